@@ -18,6 +18,8 @@ logging_format = "%(asctime)s: %(message)s"
 logging.basicConfig(format=logging_format, level=logging.INFO,
 datefmt="%H:%M:%S")
 logging.getLogger().setLevel(logging.DEBUG)
+# Keep RossROS itself out of DEBUG so its buses and nodes run in fast mode; use set_trace() on a bus or node to follow it
+rr.logger.setLevel(logging.INFO)
 try:
     from robot_hat import Pin, ADC, PWM, Servo, fileDB
     from robot_hat import Grayscale_Module, Ultrasonic
@@ -156,7 +158,8 @@ class interp(object):
 
         #greys = self.get_grayscale_data()
         #if isinstance(greys, list) and len(greys) == 3:
-        if greys != None:
+        #Identity check so that NumPy array samples work as well as lists
+        if greys is not None:
             #greys = self.get_grayscale_data()
             grey_avg = (greys[0] + greys[1] + greys[2])/3
             greys_norm = [(greys[0]/grey_avg), (greys[1]/grey_avg), (greys[2]/grey_avg)]
@@ -752,27 +755,35 @@ if __name__ == "__main__":
     # move_bus = bus()
     # grey_bus = bus()
 
-    bSensor = rr.Bus(sense.get_grayscale_data(), "Grey Scale Bus")
-    bInterpret = rr.Bus(inter.get_calc_contrast(sense.get_grayscale_data()), "Interpret Bus")
-    bUltra = rr.Bus(px.dodge_this(), "Obstacle Bus")
+    bSensor = rr.SingleWriterBus(sense.get_grayscale_data(), "Grey Scale Bus")
+    bInterpret = rr.SingleWriterBus(inter.get_calc_contrast(sense.get_grayscale_data()), "Interpret Bus")
+    bUltra = rr.SingleWriterBus(px.dodge_this(), "Obstacle Bus")
     bControl = rr.Bus(controller.drive(inter.get_calc_contrast(sense.get_grayscale_data()), px.dodge_this()), "Control bus")
     bTerminate = rr.Bus(0, "Termination Bus")
+    bFault = rr.Bus((), "Fault Bus")
 
     # Wrap the square wave signal generator into a producer
     readGrey = rr.Producer(
         sense.get_grayscale_data,  # function that will generate data
         bSensor,  # output data bus
-        0.05,  # delay between data generation cycles
+        0.05,  # delay between data generation cycles (unused in period mode)
         bTerminate,  # bus to watch for termination signal
-        "Read the greyscale data")
+        "Read the greyscale data",
+        period=0.05,  # sample on a fixed grid, starting at 20 Hz
+        adaptive_rate=(0.02, 0.1),  # up to 50 Hz while the line moves under the sensor, down to 10 Hz when not
+        change_threshold=50,  # ignore grayscale changes smaller than this (sensor noise)
+        trace_latency=True)  # time each sample through to the steering servo
 
     # Wrap the square wave signal generator into a producer
     readUltra = rr.Producer(
         px.dodge_this,  # function that will generate data
         bUltra,  # output data bus
-        0.05,  # delay between data generation cycles
+        0.05,  # delay between data generation cycles (unused in period mode)
         bTerminate,  # bus to watch for termination signal
-        "Read the ultrasonic data")
+        "Read the ultrasonic data",
+        period=0.05,  # sample on a fixed grid, starting at 20 Hz
+        adaptive_rate=(0.05, 0.25),  # 20 Hz around obstacle changes, down to 4 Hz while nothing changes
+        trace_latency=True)  # time each sample through to the steering servo
 
 
     # Wrap the multiplier function into a consumer-producer
@@ -780,17 +791,31 @@ if __name__ == "__main__":
         inter.get_calc_contrast,  # function that will process data
         bSensor,  # input data buses
         bInterpret,  # output data bus
-        0.05,  # delay between data control cycles
+        0.05,  # delay (ignored in trigger mode)
         bTerminate,  # bus to watch for termination signal
-        "Calculate the greyscale turning angle")
+        "Calculate the greyscale turning angle",
+        trigger="any")  # run only, and immediately, when a new greyscale sample arrives
     
     # Wrap the data controlCar into a consumer
     controlCar = rr.Consumer(
             controller.drive,  # function that will process data
             (bInterpret, bUltra),  # input data buses
-            0.05,  # delay between data control cycles
+            0.05,  # delay (ignored in trigger mode)
             bTerminate,  # bus to watch for termination signal
-            "Control PiCar")
+            "Control PiCar",
+            trigger="any")  # steer only, and immediately, when the steering value or obstacle reading arrives
+
+    # Stop the car and the program if either sensor stops delivering, e.g. on a stalled I2C transfer
+    watchSensors = rr.Watchdog(
+            (bSensor, bUltra),  # buses that must keep being written
+            (0.3, 0.75),  # deadlines: three times the slowest adaptive sampling period of each sensor
+            bFault,  # bus that receives the names of the stale buses
+            px.stop,  # reaction: stop the motors straight away
+            0.05,  # how often to check
+            bTerminate,  # bus to watch for termination signal
+            "Sensor watchdog",
+            fault_termination_bus=bTerminate,  # then end the run
+            period=0.05)  # check on a fixed grid, so the reaction time is bounded by the deadline plus 50 ms
     """ Fourth Part: Create RossROS Printer and Timer objects """
 
     # Make a printer that returns the most recent wave and product values
@@ -817,10 +842,30 @@ if __name__ == "__main__":
                                 controlCar,
                                 readUltra,
                                 printBuses, 
+                                watchSensors,
                                 terminationTimer]
     
+    #Keep the sense-interpret-control loop on its own core at real-time priority, and the printer off it
+    realtime = {readGrey: rr.RealtimeProfile(cpus={3}, priority=50),
+                interpCalc: rr.RealtimeProfile(cpus={3}, priority=50),
+                controlCar: rr.RealtimeProfile(cpus={3}, priority=60),
+                printBuses: rr.RealtimeProfile(cpus={0, 1, 2})}
+
     #Execute the list of producer-consumers concurrently
-    rr.runConcurrently(producer_consumer_list)
+    rr.runConcurrently(producer_consumer_list, realtime=realtime, disable_gen2=True)
+
+    #Report how much of the control budget each node used
+    for cp in producer_consumer_list:
+        stats = cp.stats()
+        logging.info(f"{cp.name}: {stats['calls']} calls, "
+                     f"exec p50/p99 {stats['exec_time']['p50']*1000:.2f}/{stats['exec_time']['p99']*1000:.2f} ms, "
+                     f"period p50 {stats['period']['p50']*1000:.1f} ms, "
+                     f"CPU load {stats['cpu_load']:.1%}")
+
+    #Report the sensor-to-actuator latency along each path through the graph
+    for path, latency in rr.latencyReport().items():
+        logging.info(f"{path}: p50 {latency['p50']*1000:.2f} ms, p99 {latency['p99']*1000:.2f} ms, "
+                     f"max {latency['max']*1000:.2f} ms")
 
     atexit.register(px.stop)
 
@@ -1,17 +1,102 @@
 #! /usr/bin/python3
+import asyncio
+import bisect
+import collections
 import concurrent.futures
+import functools
+import gc
+import inspect
+import itertools
+import math
+import multiprocessing
+import numbers
+import os
+import pickle
+import queue
+import socket
+import struct
+import threading
 import time
+import types
+import zlib
 import logging
+from array import array
+from multiprocessing import shared_memory
 from readerwriterlock import rwlock
+import rr_timing
 from logdecorator import log_on_start, log_on_end, log_on_error
+try:
+    import numpy as np
+    ndarray_type = np.ndarray
+except ImportError:
+    np = None
+    ndarray_type = None
 
 DEBUG = logging.DEBUG
 logging_format = "%(asctime)s: %(message)s"
 logging.basicConfig(format=logging_format, level=logging.INFO,
                     datefmt="%H:%M:%S")
 
+# Logger used by the logging decorators on the RossROS classes
+logger = logging.getLogger(__name__)
 
-class Bus:
+# In fast mode, each object binds the undecorated versions of its logged methods when it is created,
+# unless DEBUG logging is enabled for this module at that point or the object has tracing switched on
+FAST_MODE = True
+
+
+class FastLogging:
+    """
+    Mixin that lets RossROS objects skip their logging decorators. The decorated methods of each class
+    are found once, when the class is created; each new object then binds either the decorated methods
+    (the class attributes) or the undecorated ones (as instance attributes), so that in fast mode a call
+    goes straight to the method body without building any log records
+    """
+
+    # Per-object trace toggle; objects start with tracing off
+    trace = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Record (name, undecorated function) for every decorated, non-special method of the class
+        cls._logged_methods = tuple(
+            (name, inspect.unwrap(method))
+            for name, method in inspect.getmembers(cls, inspect.isfunction)
+            if hasattr(method, '__wrapped__') and not name.startswith('__'))
+
+    def __new__(cls, *args, **kwargs):
+
+        # Resolve the method bindings before __init__ runs, so that bound methods handed out during
+        # construction (such as Timer's timer function) already point at the right version
+        self = super().__new__(cls)
+        self.resolve_logging()
+        return self
+
+    def resolve_logging(self):
+        """
+        Bind the decorated methods if tracing is on, fast mode is off, or DEBUG logging is enabled, and the
+        undecorated methods otherwise
+        """
+
+        decorated = self.trace or not FAST_MODE or logger.isEnabledFor(DEBUG)
+        for name, raw_method in self._logged_methods:
+            if decorated:
+                self.__dict__.pop(name, None)
+            else:
+                setattr(self, name, types.MethodType(raw_method, self))
+
+    def set_trace(self, enabled=True):
+        """
+        Switch the logging decorators on or off for this object while it is running. DEBUG logging must
+        also be enabled for the rossros logger for the trace records to be shown
+        """
+
+        self.trace = enabled
+        self.resolve_logging()
+
+
+class Bus(FastLogging):
     """
     Class for passing broadcast messages between processes.
     """
@@ -23,9 +108,31 @@ class Bus:
         self.message = initial_message
         self.name = name
 
+        # Sequence number of the most recent write, increased by one on every set_message
+        self.seq = 0
+
+        # time.monotonic() time of the most recent write (or of the bus's creation)
+        self.timestamp = time.monotonic()
+
+        # Latency trace carried by the current message, if any: (trace id, acquisition time, path of
+        # node names the data has passed through)
+        self.msg_trace = None
+
         # Set up the class so that functions can get a lock while working
         self.lock = rwlock.RWLockFairD()
 
+        # Condition variable notified on every write, so that readers can block until new data arrives
+        self.update_condition = threading.Condition()
+
+        # Functions called after every write; replaced as a whole when changed, so writers can iterate
+        # over it without a lock
+        self.listeners = ()
+
+        # Functions called after every write with its time and the message written, for listeners that
+        # need the message itself (by the time a plain listener reads the bus, a later write may have
+        # replaced it)
+        self.write_listeners = ()
+
     @log_on_start(DEBUG, "{self.name:s}: Initiating read by {_name:s}")
     @log_on_error(DEBUG, "{self.name:s}: Error on read by {_name:s}")
     @log_on_end(DEBUG, "{self.name:s}: Finished read by {_name:s}")
@@ -42,7 +149,673 @@ class Bus:
     def set_message(self, message, _name='Unspecified function'):
 
         with self.lock.gen_wlock():
-            self.message = message
+            self.store_message(message)
+            message = self.message
+
+        self.notify_update(message)
+
+    @log_on_start(DEBUG, "{self.name:s}: Waiting for update by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error while waiting for update by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished waiting for update by {_name:s}")
+    def wait_for_update(self, since_seq=None, timeout=None, _name='Unspecified function'):
+        """
+        Block until the bus has been written after sequence number since_seq (or, if since_seq is None,
+        until the next write), or until timeout seconds have passed. Returns the current sequence number,
+        which the caller compares against since_seq to tell a new message from a timeout
+        """
+
+        with self.update_condition:
+            if since_seq is None:
+                since_seq = self.seq
+            self.update_condition.wait_for(lambda: self.seq != since_seq, timeout)
+            return self.seq
+
+    def store_message(self, message):
+        """
+        Store a new message; called by set_message while holding the write lock. Subclasses that keep
+        more than the latest message extend this
+        """
+
+        # NumPy arrays are published read-only, so that readers can share them without copying; a writer
+        # that wants to change a published array must make a copy (copy-on-write)
+        if ndarray_type is not None and isinstance(message, ndarray_type):
+            message.flags.writeable = False
+
+        self.message = message
+
+    def notify_update(self, message):
+        """
+        Advance the sequence number after a write of message, wake up any readers waiting for new data,
+        and call the registered listeners
+        """
+
+        timestamp = self.timestamp = time.monotonic()
+
+        with self.update_condition:
+            self.seq += 1
+            self.update_condition.notify_all()
+
+        for listener in self.listeners:
+            listener()
+        for listener in self.write_listeners:
+            listener(timestamp, message)
+
+    def add_listener(self, listener):
+        """
+        Register a function (taking no arguments) to be called after every write, from the writing thread.
+        Listeners must be quick and must not block, e.g. setting an event or scheduling a callback
+        """
+
+        self.listeners = self.listeners + (listener,)
+
+    def remove_listener(self, listener):
+        """
+        Unregister a function added with add_listener
+        """
+
+        self.listeners = tuple(l for l in self.listeners if l is not listener)
+
+    def add_write_listener(self, listener):
+        """
+        Register a function to be called after every write with the write time and the message written,
+        from the writing thread, under the same rules as add_listener
+        """
+
+        self.write_listeners = self.write_listeners + (listener,)
+
+    def remove_write_listener(self, listener):
+        """
+        Unregister a function added with add_write_listener
+        """
+
+        self.write_listeners = tuple(l for l in self.write_listeners if l is not listener)
+
+
+class SingleWriterBus(Bus):
+    """
+    Bus for the common case of exactly one writer. Instead of taking a reader-writer lock on every call,
+    the writer publishes each message with a single reference assignment, which the interpreter performs
+    atomically, and then advances the sequence number (seqlock style: a reader that sees sequence number
+    n is guaranteed to see message n or a newer one). Readers never block and never allocate a lock
+    context. get_message, set_message and wait_for_update behave as they do on Bus, so a graph can switch
+    a bus over by changing its class. Concurrent writers are not protected against each other
+    """
+
+    @log_on_start(DEBUG, "{self.name:s}: Initiating read by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on read by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished read by {_name:s}")
+    def get_message(self, _name='Unspecified function'):
+
+        return self.message
+
+    @log_on_start(DEBUG, "{self.name:s}: Initiating write by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on write by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished write by {_name:s}")
+    def set_message(self, message, _name='Unspecified function'):
+
+        # Publish the new message before advancing the sequence number
+        self.store_message(message)
+
+        self.notify_update(self.message)
+
+
+class ArrayBus(Bus):
+    """
+    Bus for NumPy array messages of a fixed shape and dtype, which cycles through a set of preallocated
+    buffers (two by default) so that publishing a sample allocates nothing. set_message copies the new
+    values into the next buffer and publishes it; a writer that can fill an array in place can instead
+    take the next buffer from acquire_buffer(), fill it, and pass it to set_message, which then publishes
+    it without any copy. Published buffers are flagged read-only and get_message returns them as they are,
+    so readers never copy either. A message stays valid until the buffers come round again (one further
+    write with two buffers); readers that keep messages longer should copy them or the bus should be given
+    more buffers
+    """
+
+    def __init__(self,
+                 initial_message=None,  # initial array; its shape and dtype fix those of the bus
+                 name="Unnamed Array Bus",
+                 shape=None,  # shape of the messages, if no initial message is given
+                 dtype=float,  # dtype of the messages, if no initial message is given
+                 buffers=2):  # number of preallocated buffers to cycle through
+
+        if np is None:
+            raise ImportError("ArrayBus needs NumPy")
+
+        if initial_message is not None:
+            initial_message = np.asarray(initial_message)
+            shape = initial_message.shape
+            dtype = initial_message.dtype
+
+        self.buffers = [np.zeros(shape, dtype) for _ in range(buffers)]
+        if initial_message is not None:
+            self.buffers[0][...] = initial_message
+        for buf in self.buffers:
+            buf.flags.writeable = False
+
+        # Index of the buffer holding the current message
+        self.front = 0
+
+        super().__init__(self.buffers[0], name)
+
+    def acquire_buffer(self):
+        """
+        Return the buffer that the next message will be published from, made writable so that the writer
+        can fill it in place before passing it to set_message. Only meant for a single writer
+        """
+
+        buf = self.buffers[(self.front + 1) % len(self.buffers)]
+        buf.flags.writeable = True
+        return buf
+
+    def store_message(self, message):
+
+        back = (self.front + 1) % len(self.buffers)
+        buf = self.buffers[back]
+
+        # Copy the values in unless the writer filled the buffer itself
+        if message is not buf:
+            buf.flags.writeable = True
+            np.copyto(buf, message)
+        buf.flags.writeable = False
+
+        self.front = back
+        self.message = buf
+
+
+class HistoryBus(Bus):
+    """
+    Bus for numeric messages that also keeps the last `length` samples and their write times in a
+    preallocated ring buffer (NumPy if it is installed, the array module otherwise). Each sample is written
+    twice, once in each half of a buffer of 2 * length rows, so that any window of recent samples is a
+    contiguous slice and can be handed out as a view without copying. Views alias the ring: a window of n
+    samples stays valid for the next length - n writes, after which it should be copied if still needed
+    """
+
+    def __init__(self,
+                 initial_message=None,  # defaults to a zero sample of the bus width
+                 name="Unnamed History Bus",
+                 length=32,  # number of samples kept
+                 width=1):  # number of values per sample, e.g. 3 for the grayscale channels
+
+        self.length = length
+        self.width = width
+
+        # Number of samples written so far (including the initial message)
+        self.count = 0
+
+        # Ring storage for values and their time.monotonic() write times
+        if np is not None:
+            self.values = np.zeros((2 * length, width) if width > 1 else 2 * length)
+            self.times = np.zeros(2 * length)
+        else:
+            self.values = array('d', bytes(8 * 2 * length * width))
+            self.times = array('d', bytes(8 * 2 * length))
+
+        if initial_message is None:
+            initial_message = 0 if width == 1 else (0,) * width
+
+        super().__init__(initial_message, name)
+        self.store_message(initial_message)
+
+    def store_message(self, message):
+
+        if self.width > 1 and (not hasattr(message, '__len__') or len(message) != self.width):
+            raise ValueError("{:s}: samples must have {:d} values, not {!r}".format(self.name, self.width, message))
+
+        self.message = message
+
+        # Write the sample into both halves of the ring, at the slot after the previous sample
+        idx = self.count % self.length
+        t = time.monotonic()
+        self.times[idx] = self.times[idx + self.length] = t
+        if self.width == 1:
+            self.values[idx] = self.values[idx + self.length] = message
+        elif np is not None:
+            self.values[idx] = self.values[idx + self.length] = message
+        else:
+            for j in range(self.width):
+                self.values[idx * self.width + j] = self.values[(idx + self.length) * self.width + j] = message[j]
+        self.count += 1
+
+    def _window_bounds(self, n):
+        # Slice bounds (in samples) of the n most recent samples, taken from the second half of the ring
+        n = min(n, self.count, self.length)
+        end = (self.count - 1) % self.length + self.length + 1
+        return end - n, end
+
+    def _views(self, start, end):
+        # Views of the times and values between two sample positions of the ring
+        if np is not None:
+            return self.times[start:end], self.values[start:end]
+        else:
+            return (memoryview(self.times)[start:end],
+                    memoryview(self.values)[start * self.width:end * self.width])
+
+    @log_on_start(DEBUG, "{self.name:s}: Initiating window read of {n} samples by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on window read by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished window read by {_name:s}")
+    def read_window(self, n, _name='Unspecified function'):
+        """
+        Return (times, values) views of the n most recent samples, oldest first. Fewer samples are returned
+        if fewer have been written. Without NumPy, multi-channel values come back as a flat row-major view
+        """
+
+        with self.lock.gen_rlock():
+            return self._views(*self._window_bounds(n))
+
+    @log_on_start(DEBUG, "{self.name:s}: Initiating read since {t} by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on read since {t} by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished read since {t} by {_name:s}")
+    def read_since(self, t, _name='Unspecified function'):
+        """
+        Return (times, values) views of the retained samples written after time.monotonic() time t
+        """
+
+        with self.lock.gen_rlock():
+            start, end = self._window_bounds(self.length)
+            # Write times are increasing, so the first sample newer than t can be found by bisection
+            if np is not None:
+                first = start + int(np.searchsorted(self.times[start:end], t, side='right'))
+            else:
+                first = bisect.bisect_right(memoryview(self.times), t, start, end)
+            return self._views(first, end)
+
+
+class QueueBus(Bus):
+    """
+    Bus that delivers every message to each of its consumers, instead of only the latest one. Each
+    consumer (identified by the name it reads with) has its own bounded ring of `capacity` messages, filled
+    on every write; ConsumerProducers subscribe to their input QueueBuses when they are constructed, and any
+    other reader is subscribed on its first read. get_message returns, as a list, all the messages
+    that arrived since the consumer's previous read (an empty list if there were none), so a node function
+    receives its inputs in batches. When a consumer's ring is full, overflow decides what happens:
+    "drop-oldest" discards the oldest queued message, "drop-newest" discards the new message, and "block"
+    makes the writer wait (up to block_timeout seconds, then drop the new message) until the consumer has
+    made room. Dropped messages are counted per consumer in `dropped`. The message attribute still holds
+    the latest message, for latest-value readers such as Printer and Recorder
+    """
+
+    overflow_policies = ("drop-oldest", "drop-newest", "block")
+
+    def __init__(self,
+                 initial_message=None,  # if not None, queued as the first message for every consumer
+                 name="Unnamed Queue Bus",
+                 capacity=64,  # messages held per consumer
+                 overflow="drop-oldest",  # "drop-oldest", "drop-newest" or "block"
+                 block_timeout=None):  # with overflow="block", longest time a write waits (None: forever)
+
+        if overflow not in self.overflow_policies:
+            raise ValueError("{:s}: overflow must be one of {!r}, not {!r}"
+                             .format(name, self.overflow_policies, overflow))
+
+        self.capacity = capacity
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.initial_message = initial_message
+
+        # Per-consumer rings and dropped-message counts, keyed by consumer name
+        self.queues = {}
+        self.dropped = {}
+
+        # Protects the rings; notified whenever a consumer takes messages, for writers blocked on a full ring
+        self.queue_condition = threading.Condition()
+
+        super().__init__(initial_message, name)
+
+    def subscribe(self, consumer_name):
+        """
+        Register a consumer, which will receive every message written from now on (and the initial
+        message, if there is one). Subscribing again under the same name does nothing
+        """
+
+        with self.queue_condition:
+            if consumer_name not in self.queues:
+                ring = collections.deque()
+                if self.initial_message is not None:
+                    ring.append(self.initial_message)
+                self.queues[consumer_name] = ring
+                self.dropped[consumer_name] = 0
+
+    def unsubscribe(self, consumer_name):
+        """
+        Remove a consumer and discard its queued messages
+        """
+
+        with self.queue_condition:
+            self.queues.pop(consumer_name, None)
+            self.dropped.pop(consumer_name, None)
+            self.queue_condition.notify_all()
+
+    @log_on_start(DEBUG, "{self.name:s}: Initiating read by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on read by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished read by {_name:s}")
+    def get_message(self, _name='Unspecified function'):
+
+        return self.get_all(_name)
+
+    def get_all(self, _name='Unspecified function', max_messages=None):
+        """
+        Take up to max_messages (default: all) of the consumer's queued messages, oldest first, as a list
+        """
+
+        with self.queue_condition:
+            ring = self.queues.get(_name)
+            if ring is None:
+                self.subscribe(_name)
+                ring = self.queues[_name]
+
+            if max_messages is None or max_messages >= len(ring):
+                messages = list(ring)
+                ring.clear()
+            else:
+                messages = [ring.popleft() for _ in range(max_messages)]
+
+            if messages:
+                self.queue_condition.notify_all()
+
+        return messages
+
+    def pending(self, consumer_name):
+        """
+        Number of messages queued for a consumer
+        """
+
+        with self.queue_condition:
+            ring = self.queues.get(consumer_name)
+            return len(ring) if ring is not None else 0
+
+    @log_on_start(DEBUG, "{self.name:s}: Initiating write by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on write by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished write by {_name:s}")
+    def set_message(self, message, _name='Unspecified function'):
+
+        with self.queue_condition:
+            if self.overflow == "block":
+                # Wait until every consumer has room (or the timeout passes)
+                self.queue_condition.wait_for(
+                    lambda: all(len(ring) < self.capacity for ring in self.queues.values()),
+                    self.block_timeout)
+
+            self.store_message(message)
+
+            for consumer_name, ring in self.queues.items():
+                if len(ring) >= self.capacity:
+                    self.dropped[consumer_name] += 1
+                    if self.overflow != "drop-oldest":
+                        continue
+                    ring.popleft()
+                ring.append(self.message)
+            message = self.message
+
+        self.notify_update(message)
+
+
+class FanoutBus(Bus):
+    """
+    Single-writer, multi-reader bus that delivers every message to each subscriber without copying it
+    per subscriber. Messages are appended to one shared ring of `capacity` slots, and each subscriber
+    (identified by the name it reads with) keeps its own cursor into the ring, so a write costs the same
+    however many subscribers there are. get_message returns, as a list, the messages written since the
+    subscriber's previous read. A subscriber that falls more than `capacity` messages behind has been lapped
+    by the writer; it is skipped forward to the oldest message still in the ring, and the messages it
+    missed are counted in `skipped`. As with SingleWriterBus, the writer does not take a lock: it fills the
+    slot before publishing the new head, and each slot holds the index of its message alongside it, so a
+    reader never returns a slot that was overwritten while it was reading. The initial message is only the latest value, not a
+    queued message; ConsumerProducers subscribe to their input FanoutBuses when they are constructed
+    """
+
+    def __init__(self,
+                 initial_message=None,
+                 name="Unnamed Fanout Bus",
+                 capacity=256):  # messages held in the shared ring
+
+        if capacity < 2:
+            raise ValueError("{:s}: a fanout bus needs a capacity of at least 2".format(name))
+        self.capacity = capacity
+        self.ring = [(None, None)] * capacity
+
+        # Number of messages written to the ring; message i lives in slot i % capacity, as (i, message)
+        self.head = 0
+
+        # Per-subscriber index of the next message to read, and count of messages skipped when lapped
+        self.cursors = {}
+        self.skipped = {}
+
+        super().__init__(initial_message, name)
+
+    def subscribe(self, consumer_name, replay=0):
+        """
+        Register a subscriber, which will receive every message written from now on, plus up to `replay`
+        of the most recent messages still in the ring. Subscribing again under the same name does nothing
+        """
+
+        if consumer_name not in self.cursors:
+            head = self.head
+            self.skipped[consumer_name] = 0
+            self.cursors[consumer_name] = max(0, head - min(replay, self.capacity))
+
+    def unsubscribe(self, consumer_name):
+        """
+        Remove a subscriber
+        """
+
+        self.cursors.pop(consumer_name, None)
+        self.skipped.pop(consumer_name, None)
+
+    def lag(self, consumer_name):
+        """
+        Number of messages written that a subscriber has not read yet
+        """
+
+        return self.head - self.cursors.get(consumer_name, self.head)
+
+    @log_on_start(DEBUG, "{self.name:s}: Initiating read by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on read by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished read by {_name:s}")
+    def get_message(self, _name='Unspecified function'):
+
+        return self.get_all(_name)
+
+    def get_all(self, _name='Unspecified function', max_messages=None):
+        """
+        Take up to max_messages (default: all) of the messages the subscriber has not read yet, oldest
+        first, as a list
+        """
+
+        cursor = self.cursors.get(_name)
+        if cursor is None:
+            self.subscribe(_name)
+            cursor = self.cursors[_name]
+
+        # Skip forward past messages the writer has already overwritten
+        oldest = self.head - self.capacity
+        if cursor < oldest:
+            self.skipped[_name] += oldest - cursor
+            cursor = oldest
+
+        end = self.head
+        if max_messages is not None:
+            end = min(end, cursor + max_messages)
+
+        # Copy the slots, dropping any that the writer reused while they were being copied (their index no
+        # longer matches)
+        slots = [self.ring[i % self.capacity] for i in range(cursor, end)]
+        messages = [message for i, (index, message) in enumerate(slots, cursor) if index == i]
+        self.skipped[_name] += len(slots) - len(messages)
+
+        self.cursors[_name] = end
+        return messages
+
+    @log_on_start(DEBUG, "{self.name:s}: Initiating write by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on write by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished write by {_name:s}")
+    def set_message(self, message, _name='Unspecified function'):
+
+        self.store_message(message)
+
+        # Fill the slot before publishing it by advancing the head
+        message = self.message
+        self.ring[self.head % self.capacity] = (self.head, message)
+        self.head += 1
+
+        self.notify_update(message)
+
+
+class SharedBus(Bus):
+    """
+    Bus whose message lives in a multiprocessing.shared_memory block, so that nodes running in different
+    processes can use it. The block has a fixed layout, set by the initial message: an 8-byte seqlock
+    counter followed by two float64 slots (value and type) for a number (bool, int or float), or one slot
+    per element for an array message (a list, tuple or NumPy array of numbers, whose length or shape cannot
+    change; elements come back as floats, or as the initial array's dtype for NumPy arrays). Writers
+    are serialized by a process-shared lock and make the counter odd while they write; readers never lock,
+    and simply re-read if the counter was odd or changed under them. Listeners and the condition variable
+    only see writes made in their own process, so wait_for_update polls the shared sequence number
+    """
+
+    # Seconds between checks of the sequence number in wait_for_update
+    poll_interval = 0.001
+
+    # Types a number message can be restored to, indexed by the type slot
+    number_types = (float, int, bool)
+
+    def __init__(self,
+                 initial_message=0,
+                 name="Unnamed Shared Bus"):
+
+        # Work out the slot layout from the initial message
+        if isinstance(initial_message, (bool, int, float)):
+            self.message_type = None
+            self.shape = None
+            size = 2
+        elif np is not None and isinstance(initial_message, np.ndarray):
+            self.message_type = ndarray_type
+            self.shape = initial_message.shape
+            self.dtype = initial_message.dtype
+            size = initial_message.size
+        elif isinstance(initial_message, (list, tuple)) and \
+                all(isinstance(v, (bool, int, float)) for v in initial_message):
+            self.message_type = type(initial_message)
+            self.shape = (len(initial_message),)
+            size = len(initial_message)
+        else:
+            raise TypeError("{:s}: a shared bus can only carry numbers or arrays of numbers, not {!r}"
+                            .format(name, initial_message))
+
+        self.payload_format = "<{:d}d".format(size)
+        self.shm = shared_memory.SharedMemory(create=True, size=8 + 8 * size)
+        self.write_lock = multiprocessing.Lock()
+
+        super().__init__(initial_message, name)
+
+    @classmethod
+    def from_bus(cls, bus):
+        """
+        Make a SharedBus with the same name and current message as an existing bus
+        """
+
+        return cls(bus.get_message(), bus.name)
+
+    def _counter(self):
+        return struct.unpack_from("<q", self.shm.buf, 0)[0]
+
+    @property
+    def seq(self):
+        # Every write advances the seqlock counter by two
+        return self._counter() // 2
+
+    @seq.setter
+    def seq(self, value):
+        struct.pack_into("<q", self.shm.buf, 0, 2 * value)
+
+    @property
+    def message(self):
+
+        # Read the payload, retrying if a write was in progress or happened while reading
+        while True:
+            counter = self._counter()
+            if counter % 2 == 0:
+                values = struct.unpack_from(self.payload_format, self.shm.buf, 8)
+                if self._counter() == counter:
+                    break
+
+        if self.shape is None:
+            # The second slot records which of the number types was written
+            return self.number_types[int(values[1])](values[0])
+        elif self.message_type is ndarray_type:
+            return np.array(values, dtype=self.dtype).reshape(self.shape)
+        else:
+            return self.message_type(values)
+
+    @message.setter
+    def message(self, message):
+
+        if self.shape is None:
+            values = (message, self.number_types.index(type(message)) if type(message) in self.number_types else 0)
+        elif self.message_type is ndarray_type:
+            values = np.asarray(message, dtype=float).ravel()
+        else:
+            values = message
+
+        with self.write_lock:
+            counter = self._counter()
+            struct.pack_into("<q", self.shm.buf, 0, counter + 1)
+            struct.pack_into(self.payload_format, self.shm.buf, 8, *values)
+            struct.pack_into("<q", self.shm.buf, 0, counter + 2)
+
+    @log_on_start(DEBUG, "{self.name:s}: Initiating read by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on read by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished read by {_name:s}")
+    def get_message(self, _name='Unspecified function'):
+
+        return self.message
+
+    @log_on_start(DEBUG, "{self.name:s}: Initiating write by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on write by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished write by {_name:s}")
+    def set_message(self, message, _name='Unspecified function'):
+
+        # The seqlock write advances the sequence number
+        self.message = message
+        self.notify_update(message)
+
+    def notify_update(self, message):
+
+        # Writes from other processes are stamped when this process's watcher notices them
+        timestamp = self.timestamp = time.monotonic()
+
+        with self.update_condition:
+            self.update_condition.notify_all()
+
+        for listener in self.listeners:
+            listener()
+        for listener in self.write_listeners:
+            listener(timestamp, message)
+
+    @log_on_start(DEBUG, "{self.name:s}: Waiting for update by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error while waiting for update by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished waiting for update by {_name:s}")
+    def wait_for_update(self, since_seq=None, timeout=None, _name='Unspecified function'):
+
+        if since_seq is None:
+            since_seq = self.seq
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while self.seq == since_seq:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(self.poll_interval)
+
+        return self.seq
+
+    def close(self, unlink=True):
+        """
+        Release the shared memory block; the process that created the bus should also unlink it
+        """
+
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
 
 
 def ensureTuple(value):
@@ -58,7 +831,204 @@ def ensureTuple(value):
     return value_tuple
 
 
-class ConsumerProducer:
+def snapshot(message):
+    """
+    Return a copy of a NumPy array message, or the message itself otherwise. Buses such as ArrayBus reuse
+    their arrays, so a message that is kept after later writes must be copied
+    """
+
+    if ndarray_type is not None and isinstance(message, ndarray_type):
+        return message.copy()
+    return message
+
+
+def batchArray(batch):
+    """
+    Return a list of queued messages as a NumPy array for batch mode: a numeric array if the messages
+    stack into one, otherwise a one-dimensional object array holding the messages as they are (such as
+    sequences of different lengths). Without NumPy the list is returned unchanged
+    """
+
+    if np is None:
+        return batch
+    try:
+        return np.asarray(batch)
+    except (ValueError, TypeError):
+        values = np.empty(len(batch), dtype=object)
+        for idx, message in enumerate(batch):
+            values[idx] = message
+        return values
+
+
+def lastElement(values):
+    """
+    Return the last element of a batch result, or the result itself if it is a single value (a number,
+    including NumPy scalars and 0-d arrays, a string or any other object without elements)
+    """
+
+    if isinstance(values, (numbers.Number, str, bytes)) or np is not None and np.ndim(values) == 0:
+        return values
+    try:
+        length = len(values)
+    except TypeError:
+        return values
+    if length == 0:
+        raise ValueError("batch result is empty, so it has no last element to write")
+    return values[-1]
+
+
+def valueChange(old, new):
+    """
+    Measure how much a bus value has changed: the absolute difference for numbers, the largest absolute
+    difference for equal-length lists, tuples or NumPy arrays of numbers, and otherwise 0 if the values
+    are equal and infinity if not
+    """
+
+    if isinstance(old, numbers.Number) and isinstance(new, numbers.Number):
+        return abs(new - old)
+    if ndarray_type is not None and isinstance(old, ndarray_type) and isinstance(new, ndarray_type) \
+            and old.shape == new.shape and old.dtype.kind in "biuf" and new.dtype.kind in "biuf":
+        return float(np.max(np.abs(new - old))) if old.size else 0.0
+    if isinstance(old, (list, tuple)) and isinstance(new, (list, tuple)) and len(old) == len(new) \
+            and all(isinstance(v, numbers.Number) for v in old) and all(isinstance(v, numbers.Number) for v in new):
+        return max((abs(b - a) for a, b in zip(old, new)), default=0.0)
+    try:
+        return 0.0 if old == new else math.inf
+    except ValueError:
+        # Comparisons that do not give a single truth value (e.g. arrays of different shapes)
+        return math.inf
+
+
+class Histogram:
+    """
+    Histogram of durations in seconds, with fixed buckets. Recording a value is a bisection and a few
+    counter updates with no allocation or locking; each histogram is meant to be written by one thread
+    (the node that owns it) and read by any, and a reader that catches a value half recorded is off by
+    at most one sample
+    """
+
+    # Upper edges of the buckets, ten per decade from 10 us to 10 s; a last bucket holds larger values
+    default_edges = tuple(10 ** (e / 10) for e in range(-50, 11))
+
+    def __init__(self, edges=None):
+
+        self.edges = tuple(edges) if edges is not None else self.default_edges
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """
+        Estimate the q-th percentile (0-100) as the upper edge of the bucket it falls in
+        """
+
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.edges[idx], self.max) if idx < len(self.edges) else self.max
+        return self.max
+
+    def summary(self):
+        """
+        Return the sample count, mean, estimated median and 99th percentile, and maximum as a dictionary
+        """
+
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.percentile(50),
+                "p99": self.percentile(99),
+                "max": self.max}
+
+
+# Source of trace ids for latency tracing
+trace_ids = itertools.count(1)
+
+# End-to-end latency histograms, keyed by the path of node names a trace took from acquisition to the
+# consumer that closed it out
+latency_histograms = {}
+latency_lock = threading.Lock()
+
+
+def recordLatency(path, latency):
+    """
+    Add a sensor-to-actuator latency sample to the histogram for a path
+    """
+
+    with latency_lock:
+        histogram = latency_histograms.get(path)
+        if histogram is None:
+            histogram = latency_histograms[path] = Histogram()
+        histogram.record(latency)
+
+
+def latencyReport():
+    """
+    Return the end-to-end latency summary (count, mean, p50, p99, max) for every traced path, keyed by a
+    string of the node names along the path
+    """
+
+    with latency_lock:
+        return {" -> ".join(path): histogram.summary() for path, histogram in latency_histograms.items()}
+
+
+def resetLatencyReport():
+    """
+    Discard all recorded end-to-end latencies
+    """
+
+    with latency_lock:
+        latency_histograms.clear()
+
+
+class TerminationSignal:
+    """
+    Stop flag for one or more nodes, backed by a threading.Event. Nodes wait on it instead of sleeping,
+    so setting it ends their sleeps and waits straight away. A node sets its signal when one of its
+    termination buses is written with a "True" or non-negative value (such as by a Timer), or when its
+    terminate() method is called; a signal passed to several nodes stops them all together
+    """
+
+    def __init__(self):
+
+        self.event = threading.Event()
+
+        # Functions called when the signal is set, e.g. to wake a node waiting for input
+        self.listeners = ()
+
+    def set(self):
+        self.event.set()
+        for listener in self.listeners:
+            listener()
+
+    def is_set(self):
+        return self.event.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the signal for at most timeout seconds, returning True if it has been set
+        """
+        return self.event.wait(timeout)
+
+    def add_listener(self, listener):
+        self.listeners = self.listeners + (listener,)
+
+    def remove_listener(self, listener):
+        self.listeners = tuple(l for l in self.listeners if l is not listener)
+
+
+class ConsumerProducer(FastLogging):
     """
     Class that turns a provided function into a service that reads from
     the input buses, stores the resulting data into the output buses,
@@ -66,6 +1036,13 @@ class ConsumerProducer:
     point the service shuts down
     """
 
+    # Whether the input buses carry real data (Producers use a placeholder input bus)
+    has_inputs = True
+
+    # Whether the node is the end of a sensor-to-actuator path, where latency traces are closed out
+    # rather than passed on to the output buses
+    closes_traces = False
+
     @log_on_start(DEBUG, "{name:s}: Starting to create consumer-producer")
     @log_on_error(DEBUG, "{name:s}: Encountered an error while creating consumer-producer")
     @log_on_end(DEBUG, "{name:s}: Finished creating consumer-producer")
@@ -75,7 +1052,22 @@ class ConsumerProducer:
                  output_buses,
                  delay=0,
                  termination_buses=Bus(False, "Default consumer_producer termination bus"),
-                 name="Unnamed consumer_producer"):
+                 name="Unnamed consumer_producer",
+                 wait_for_input=False,  # block on the first input bus instead of sleeping
+                 period=None,  # run at a fixed rate with this many seconds between releases
+                 overrun="skip",  # what to do in period mode when a cycle runs past the next release
+                 trigger=None,  # "any" or "all": run only when any or all input buses have new messages
+                 min_interval=0,  # in trigger mode, the shortest time between the starts of two cycles
+                 termination_signal=None,  # TerminationSignal to share with other nodes (default: own one)
+                 stats_bus=None,  # bus that receives the node's stats() every stats_interval seconds
+                 stats_interval=1.0,
+                 trace_latency=False,  # start a latency trace with each message this node writes
+                 max_batch=None,  # batch mode: most messages taken from each queued input per call
+                 batch_output="last",  # in batch mode, "last" or "batch": what is written to the outputs
+                 timing=None,  # rr_timing.HybridSleeper (or True for a default one) for precise pauses
+                 adaptive_rate=None,  # (shortest, longest) delay or period to adapt between, or None
+                 change_threshold=0.0,  # smallest change in an input or output value that counts as activity
+                 adapt_smoothing=0.2):  # weight of the latest cycle in the activity level (0-1)
 
         self.consumer_producer_function = consumer_producer_function
         self.input_buses = ensureTuple(input_buses)
@@ -84,29 +1076,426 @@ class ConsumerProducer:
         self.termination_buses = ensureTuple(termination_buses)
         self.name = name
 
+        # Queue and fanout buses deliver every message to each subscribed consumer, so subscribe before
+        # anything is written to them
+        for bus in self.input_buses:
+            if isinstance(bus, (QueueBus, FanoutBus)):
+                bus.subscribe(name)
+
+        # In wait_for_input mode, the loop runs as soon as the first input bus receives a new message,
+        # and delay becomes the longest it will wait for one before running anyway
+        self.wait_for_input = wait_for_input
+
+        # In period mode, cycles are released on a fixed grid of time.monotonic() deadlines, so that
+        # execution time does not add to the period, and delay is not used. When a cycle overruns,
+        # "skip" drops the missed releases and waits for the next one on the grid, "catchup" runs the
+        # missed releases back to back, and "late" runs once immediately and restarts the grid from there
+        if period is not None and wait_for_input:
+            raise ValueError("period and wait_for_input cannot both be used")
+        if overrun not in ("skip", "catchup", "late"):
+            raise ValueError("overrun must be 'skip', 'catchup' or 'late'")
+        self.period = period
+        self.overrun = overrun
+
+        # In trigger mode, the node runs once at start-up and then only when any (or all) of its input
+        # buses have been written since its last cycle read them, and no sooner than min_interval after
+        # that cycle started. Nothing runs while the inputs are unchanged, and delay is ignored: the node
+        # waits on its input and termination writes without a timeout
+        if trigger not in (None, "any", "all"):
+            raise ValueError("trigger must be None, 'any' or 'all'")
+        if trigger is not None and (period is not None or wait_for_input):
+            raise ValueError("trigger cannot be combined with period or wait_for_input")
+        self.trigger = trigger
+        self.min_interval = min_interval
+
+        # Set by the watched input buses on every write, and on termination, to wake a waiting node
+        self.trigger_event = threading.Event()
+
+        # Set when the node should stop; writes to the termination buses are checked as they happen, so
+        # the loop itself only looks at this flag, and its sleeps are waits on it
+        if termination_signal is None:
+            termination_signal = TerminationSignal()
+        self.termination_signal = termination_signal
+
+        # Runtime instrumentation, updated only by the thread running the node: number of calls to the
+        # function, how long each call takes, the time between the starts of successive cycles, the CPU
+        # time used by the node's cycles, and how old the oldest input message is when a cycle reads it
+        self.call_count = 0
+        self.exec_histogram = Histogram()
+        self.period_histogram = Histogram()
+        self.input_age_histogram = Histogram()
+        self.cpu_time = 0.0
+        self.first_cycle_start = None
+        self.last_cycle_start = None
+
+        self.stats_bus = stats_bus
+        self.stats_interval = stats_interval
+        self.next_stats_time = 0.0
+
+        # Latency tracing: a node with trace_latency set stamps each output message with a new trace id and
+        # the time just before its function ran (the acquisition time). Other nodes pass the oldest trace
+        # on their inputs through to their outputs, adding their name to its path, and Consumers close the
+        # traces they read out into the per-path latency histograms (see latencyReport), once per trace
+        self.trace_latency = trace_latency
+        self.closed_trace_ids = {}
+
+        # Batch mode: each cycle drains up to max_batch pending messages from every QueueBus or FanoutBus
+        # input and passes them to the function in one call, as a NumPy array (see batchArray; a list if
+        # NumPy is not installed); other inputs are passed as usual. A cycle with no pending queued messages does not
+        # call the function. With batch_output "batch", the function's result is written to the outputs
+        # as one message; with "last", only its last element (per output) is written, or the result itself
+        # if the function reduced the batch to a single value
+        if batch_output not in ("last", "batch"):
+            raise ValueError("batch_output must be 'last' or 'batch'")
+        if max_batch is not None and not any(isinstance(bus, (QueueBus, FanoutBus)) for bus in self.input_buses):
+            raise ValueError("{:s}: max_batch needs at least one QueueBus or FanoutBus input".format(name))
+        self.max_batch = max_batch
+        self.batch_output = batch_output
+
+        # With a HybridSleeper, the pauses between cycles (delay, period releases and min_interval) sleep
+        # coarsely and spin for the last stretch, instead of relying on the accuracy of a plain wait
+        if timing is True:
+            timing = rr_timing.HybridSleeper()
+        self.sleeper = timing
+
+        # Adaptive rate: after each cycle the node checks whether any input value or its output value
+        # changed by more than change_threshold since the previous cycle, and keeps a smoothed activity
+        # level between 0 (nothing changes) and 1 (something changes every cycle). Its delay (or period, in
+        # period mode) is then set between the longest value at activity 0 and the shortest at activity 1,
+        # interpolated geometrically, so a busy node speeds up within a few cycles and an idle one backs off
+        if adaptive_rate is not None:
+            if trigger is not None:
+                raise ValueError("adaptive_rate cannot be combined with trigger")
+            if not 0 < adaptive_rate[0] <= adaptive_rate[1]:
+                raise ValueError("adaptive_rate must be (shortest, longest) with 0 < shortest <= longest")
+        self.adaptive_rate = adaptive_rate
+        self.change_threshold = change_threshold
+        self.adapt_smoothing = adapt_smoothing
+        self.activity = 1.0
+        self.last_input_values = None
+        self.last_output_values = None
+
+        # Release timing record for period mode: lateness of each release relative to its deadline,
+        # cycles that ran past the next release, and releases dropped by the "skip" policy
+        self.cycle_count = 0
+        self.jitter_last = 0.0
+        self.jitter_max = 0.0
+        self.jitter_sum = 0.0
+        self.overrun_count = 0
+        self.skipped_count = 0
+
     @log_on_start(DEBUG, "{self.name:s}: Starting consumer-producer service")
     @log_on_error(DEBUG, "{self.name:s}: Encountered an error while executing consumer-producer")
     @log_on_end(DEBUG, "{self.name:s}: Closing down consumer-producer service")
     def __call__(self):
 
-        while True:
+        # First release in period mode is immediate
+        release = time.monotonic()
+
+        self.attachListeners(self.trigger_event.set)
 
-            # Check if the loop should terminate
-            # termination_value = self.termination_buses[0].get_message(self.name)
+        try:
+            # Catch termination buses that were already set before the listeners were attached
             if self.checkTerminationbuses():
-                break
+                self.terminate()
+
+            while not self.termination_signal.is_set():
+
+                if self.period is not None:
+                    self.recordRelease(release)
+
+                cycle_start = time.monotonic()
+                input_seqs = self.runCycle()
+
+                if self.period is not None:
+                    # Wait until the next release on the fixed-rate grid
+                    release = self.nextRelease(release)
+                    self.pauseFor(release - time.monotonic())
+                elif self.wait_for_input:
+                    # Wait for a new message on the trigger bus, for at most the set amount of time
+                    self.trigger_event.clear()
+                    if self.input_buses[0].seq == input_seqs[0] and not self.termination_signal.is_set():
+                        self.trigger_event.wait(self.delay)
+                elif self.trigger is not None:
+                    # Wait until the inputs have changed
+                    while not self.inputsTriggered(input_seqs):
+                        if self.termination_signal.is_set():
+                            return
+                        self.trigger_event.wait()
+                    self.pauseFor(cycle_start + self.min_interval - time.monotonic())
+                else:
+                    # Pause for set amount of time
+                    self.pauseFor(self.delay)
+        finally:
+            self.detachListeners(self.trigger_event.set)
+
+    def watchedBuses(self):
+        """
+        Input buses whose writes wake the node: the first one in wait_for_input mode, all of them in
+        trigger mode, and none otherwise
+        """
+
+        if self.wait_for_input:
+            return self.input_buses[:1]
+        elif self.trigger is not None:
+            return self.input_buses
+        else:
+            return ()
 
-            # Collect all of the values from the input buses into a list
-            input_values = self.collectbusesToValues(self.input_buses)
+    def pauseFor(self, seconds):
+        """
+        Pause for the given number of seconds, returning early if the node is terminated
+        """
 
-            # Get the output value or tuple of values corresponding to the inputs
-            output_values = self.consumer_producer_function(*input_values)
+        if self.sleeper is not None:
+            self.sleeper.wait(max(0.0, seconds), self.termination_signal)
+        else:
+            self.termination_signal.wait(max(0.0, seconds))
+
+    def attachListeners(self, wake):
+        """
+        Register the node's listeners: termination bus writes are checked as they happen, and writes to
+        the watched input buses and termination both call wake
+        """
+
+        for bus in self.termination_buses:
+            bus.add_listener(self.onTerminationWrite)
+        for bus in self.watchedBuses():
+            bus.add_listener(wake)
+        self.termination_signal.add_listener(wake)
+
+    def detachListeners(self, wake):
+        """
+        Remove the listeners registered by attachListeners
+        """
+
+        for bus in self.termination_buses:
+            bus.remove_listener(self.onTerminationWrite)
+        for bus in self.watchedBuses():
+            bus.remove_listener(wake)
+        self.termination_signal.remove_listener(wake)
+
+    def onTerminationWrite(self):
+        # Called from the writing thread whenever one of the termination buses is written
+        if self.checkTerminationbuses():
+            self.terminate()
+
+    def terminate(self):
+        """
+        Stop the node (and any other nodes sharing its termination signal) at once
+        """
+
+        self.termination_signal.set()
+
+    def runCycle(self):
+        """
+        Run one cycle of the service: read the input buses, call the function, and write the output buses.
+        Returns the sequence numbers the input buses had before they were read
+        """
+
+        cycle_start = time.monotonic()
+        cpu_start = time.thread_time()
+
+        # Note the sequence numbers of the input buses before reading them, so that a write that lands
+        # while the function is running wakes the next wait immediately
+        input_seqs = tuple(bus.seq for bus in self.input_buses)
+
+        # Collect all of the values from the input buses into a list, along with the traces they carry
+        input_values = self.collectbusesToValues(self.input_buses)
+        input_traces = [bus.msg_trace for bus in self.input_buses if bus.msg_trace is not None]
+
+        # In batch mode, there is nothing to do until some queued input has a message
+        if self.max_batch is not None and not any(
+                len(value) for value, bus in zip(input_values, self.input_buses)
+                if isinstance(bus, (QueueBus, FanoutBus))):
+            return input_seqs
+
+        # Get the output value or tuple of values corresponding to the inputs
+        acquired = time.monotonic()
+        call_start = time.perf_counter()
+        output_values = self.consumer_producer_function(*input_values)
+        call_time = time.perf_counter() - call_start
+
+        if self.max_batch is not None and self.batch_output == "last":
+            output_values = self.lastOfBatch(output_values)
+
+        if self.adaptive_rate is not None:
+            self.adaptRate(input_values, output_values)
+
+        # Deal the values into the output buses, or close out the traces at the end of a path
+        if self.closes_traces:
+            self.closeTraces(input_traces)
+        else:
+            self.dealValuesTobuses(output_values, self.output_buses, self.outputTrace(input_traces, acquired))
+
+        self.recordCycle(cycle_start, call_time, time.thread_time() - cpu_start)
+
+        return input_seqs
+
+    def adaptRate(self, input_values, output_values):
+        """
+        Update the activity level from this cycle's input and output values, and set the node's delay (or
+        period) to match it
+        """
+
+        if self.last_input_values is not None:
+            changed = valueChange(self.last_output_values, output_values) > self.change_threshold or \
+                any(valueChange(old, new) > self.change_threshold
+                    for old, new in zip(self.last_input_values, input_values))
+            self.activity += self.adapt_smoothing * (float(changed) - self.activity)
+        self.last_input_values = [snapshot(value) for value in input_values]
+        self.last_output_values = snapshot(output_values)
+
+        shortest, longest = self.adaptive_rate
+        interval = longest * (shortest / longest) ** self.activity
+        if self.period is not None:
+            self.period = interval
+        else:
+            self.delay = interval
 
-            # Deal the values into the output buses
-            self.dealValuesTobuses(output_values, self.output_buses)
+    def lastOfBatch(self, output_values):
+        """
+        Reduce a batch result to its last element, or to the last element of each entry when it is a tuple
+        with one entry per output bus
+        """
 
-            # Pause for set amount of time
-            time.sleep(self.delay)
+        if len(self.output_buses) > 1 and isinstance(output_values, tuple):
+            return tuple(lastElement(values) for values in output_values)
+        else:
+            return lastElement(output_values)
+
+    def outputTrace(self, input_traces, acquired):
+        """
+        Work out the trace for this cycle's output messages: a new one if the node starts traces, otherwise
+        the oldest input trace extended by this node, or None if no input was traced
+        """
+
+        if self.trace_latency:
+            return next(trace_ids), acquired, (self.name,)
+        elif input_traces:
+            trace_id, trace_acquired, path = min(input_traces, key=lambda trace: trace[1])
+            return trace_id, trace_acquired, path + (self.name,)
+        else:
+            return None
+
+    def closeTraces(self, input_traces):
+        """
+        Record the end-to-end latency of each input trace that this node has not closed out before
+        """
+
+        now = time.monotonic()
+        for trace_id, acquired, path in input_traces:
+            if self.closed_trace_ids.get(path) != trace_id:
+                self.closed_trace_ids[path] = trace_id
+                recordLatency(path + (self.name,), now - acquired)
+
+    def recordCycle(self, cycle_start, call_time, cpu_time):
+        """
+        Update the runtime instrumentation after a cycle, and publish the stats if they are due
+        """
+
+        self.call_count += 1
+        self.exec_histogram.record(call_time)
+        self.cpu_time += cpu_time
+
+        if self.last_cycle_start is not None:
+            self.period_histogram.record(cycle_start - self.last_cycle_start)
+        else:
+            self.first_cycle_start = cycle_start
+        self.last_cycle_start = cycle_start
+
+        if self.has_inputs and self.input_buses:
+            self.input_age_histogram.record(cycle_start - min(bus.timestamp for bus in self.input_buses))
+
+        if self.stats_bus is not None and cycle_start >= self.next_stats_time:
+            self.next_stats_time = cycle_start + self.stats_interval
+            self.stats_bus.set_message(self.stats(), self.name)
+
+    def stats(self):
+        """
+        Return the node's runtime instrumentation as a dictionary: call count, summaries of the function
+        execution time, the actual period and the input age, the CPU time used and its share of the time
+        the node has been running, for period-mode nodes the release timing record, for nodes with a
+        HybridSleeper its wake-up error record, and for adaptive-rate nodes their activity level and
+        current delay or period
+        """
+
+        running_time = (self.last_cycle_start - self.first_cycle_start) if self.call_count > 1 else 0.0
+
+        stats = {"name": self.name,
+                 "calls": self.call_count,
+                 "exec_time": self.exec_histogram.summary(),
+                 "period": self.period_histogram.summary(),
+                 "cpu_time": self.cpu_time,
+                 "cpu_load": self.cpu_time / running_time if running_time else 0.0,
+                 "input_age": self.input_age_histogram.summary() if self.has_inputs and self.input_buses else None}
+        if self.period is not None:
+            stats["release"] = self.timing_stats()
+        if self.sleeper is not None:
+            stats["wake_error"] = self.sleeper.stats()
+        if self.adaptive_rate is not None:
+            stats["adaptive"] = {"activity": self.activity,
+                                 "interval": self.period if self.period is not None else self.delay}
+
+        return stats
+
+    def inputsTriggered(self, input_seqs):
+        """
+        In trigger mode, check whether any (or all) of the input buses have moved on from the sequence
+        numbers they had when the last cycle read them. Clears the trigger event first, so that a write
+        made after the check wakes the next wait
+        """
+
+        self.trigger_event.clear()
+        changed = [bus.seq != seq for bus, seq in zip(self.input_buses, input_seqs)]
+        return any(changed) if self.trigger == "any" else all(changed)
+
+    def recordRelease(self, release):
+        """
+        Record how late the current cycle started relative to its scheduled release time
+        """
+
+        jitter = time.monotonic() - release
+        self.cycle_count += 1
+        self.jitter_last = jitter
+        self.jitter_sum += jitter
+        if jitter > self.jitter_max:
+            self.jitter_max = jitter
+
+    def nextRelease(self, release):
+        """
+        Work out the release time of the next cycle from that of the current one, applying the overrun
+        policy if the current cycle finished after the next release was due
+        """
+
+        next_release = release + self.period
+        now = time.monotonic()
+
+        if now > next_release:
+            self.overrun_count += 1
+            if self.overrun == "skip":
+                # Move to the first release on the grid that is still in the future
+                missed = int((now - next_release) // self.period) + 1
+                self.skipped_count += missed
+                next_release += missed * self.period
+            elif self.overrun == "late":
+                # Start a new grid from the current time
+                next_release = now
+            # With "catchup", the missed release keeps its place on the grid and runs straight away
+
+        return next_release
+
+    def timing_stats(self):
+        """
+        Return the release timing record of a period-mode node as a dictionary
+        """
+
+        return {"cycles": self.cycle_count,
+                "jitter_last": self.jitter_last,
+                "jitter_max": self.jitter_max,
+                "jitter_mean": self.jitter_sum / self.cycle_count if self.cycle_count else 0.0,
+                "overruns": self.overrun_count,
+                "skipped": self.skipped_count}
 
     # Take in a bus or a tuple of buses, and store their
     # messages into a list
@@ -123,7 +1512,11 @@ class ConsumerProducer:
 
         # Loop over the buses, recording their values
         for p in buses:
-            values.append(p.get_message(self.name))
+            if self.max_batch is not None and isinstance(p, (QueueBus, FanoutBus)):
+                # Batch mode: drain the pending messages into a single array
+                values.append(batchArray(p.get_all(self.name, self.max_batch)))
+            else:
+                values.append(p.get_message(self.name))
 
         return values
 
@@ -132,7 +1525,7 @@ class ConsumerProducer:
     @log_on_start(DEBUG, "{self.name:s}: Starting dealing values into buses")
     @log_on_error(DEBUG, "{self.name:s}: Encountered an error while dealing values into buses")
     @log_on_end(DEBUG, "{self.name:s}: Finished dealing values into buses")
-    def dealValuesTobuses(self, values, buses):
+    def dealValuesTobuses(self, values, buses, trace=None):
 
         # Wrap buses in a tuple if it isn't one already
         buses = ensureTuple(buses)
@@ -155,6 +1548,7 @@ class ConsumerProducer:
                 values = tuple([values]*len(buses))
 
         for idx, v in enumerate(values):
+            buses[idx].msg_trace = trace
             buses[idx].set_message(v, self.name)
 
     @log_on_start(DEBUG, "{self.name:s}: Starting to check termination buses")
@@ -177,6 +1571,8 @@ class Producer(ConsumerProducer):
     but does not read them
     """
 
+    has_inputs = False
+
     @log_on_start(DEBUG, "{name:s}: Starting to create producer")
     @log_on_error(DEBUG, "{name:s}: Encountered an error while creating producer")
     @log_on_end(DEBUG, "{name:s}: Finished creating producer")
@@ -185,7 +1581,8 @@ class Producer(ConsumerProducer):
                  output_buses,
                  delay=0,
                  termination_buses=Bus(False, "Default producer termination bus"),
-                 name="Unnamed producer"):
+                 name="Unnamed producer",
+                 **kwargs):  # keyword options of ConsumerProducer, such as period
 
         # Producers don't use an input bus
         input_buses = Bus(0, "Default producer input bus")
@@ -202,7 +1599,8 @@ class Producer(ConsumerProducer):
             output_buses,
             delay,
             termination_buses,
-            name)
+            name,
+            **kwargs)
 
 
 class Consumer(ConsumerProducer):
@@ -211,6 +1609,8 @@ class Consumer(ConsumerProducer):
     but does not send to them
     """
 
+    closes_traces = True
+
     @log_on_start(DEBUG, "{name:s}: Starting to create consumer")
     @log_on_error(DEBUG, "{name:s}: Encountered an error while creating consumer")
     @log_on_end(DEBUG, "{name:s}: Finished creating consumer")
@@ -219,7 +1619,8 @@ class Consumer(ConsumerProducer):
                  input_buses,
                  delay=0,
                  termination_buses=Bus(False, "Default consumer termination bus"),
-                 name="Unnamed consumer"):
+                 name="Unnamed consumer",
+                 **kwargs):  # keyword options of ConsumerProducer, such as wait_for_input or period
 
         # Match naming convention for this class with its parent class
         consumer_producer_function = consumer_function
@@ -234,7 +1635,8 @@ class Consumer(ConsumerProducer):
             output_buses,
             delay,
             termination_buses,
-            name)
+            name,
+            **kwargs)
 
 
 class Timer(Producer):
@@ -253,14 +1655,16 @@ class Timer(Producer):
                  duration=5,  # how many seconds the timer should run for (0 is forever)
                  delay=0,  # how many seconds to sleep for between checking time
                  termination_buses=Bus(False, "Default timer termination bus"),
-                 name="Unnamed termination timer"):
+                 name="Unnamed termination timer",
+                 **kwargs):  # keyword options of ConsumerProducer
 
         super().__init__(
             self.timer,  # Timer class defines its own producer function
             output_buses,
             delay,
             termination_buses,
-            name)
+            name,
+            **kwargs)
 
         self.duration = duration
         self.t_start = time.time()
@@ -282,8 +1686,22 @@ class Timer(Producer):
 class Printer(Consumer):
     """
     Printer is a consumer that reads a value stored in a bus and prints it out at specified intervals
+
+    Lines are formatted with a column template that is built once for each combination of message types,
+    and handed to a writer thread through a bounded queue, so a slow terminal or SSH session never holds
+    up the printer's own thread. If the queue is full, "coalesce" replaces the lines still waiting with
+    the newest one and "drop" discards the newest one; either way dropped_lines counts the lines lost.
+    With on_change set, a line is only printed when the messages differ from the last line printed
     """
 
+    # Printing is monitoring, not the end of a sensor-to-actuator path
+    closes_traces = False
+
+    # Column formats: numbers get 4 significant figures with a space in place of a plus sign, and every
+    # column is padded to 11 characters
+    number_column = " {:< 11.4g}"
+    text_column = " {!s:<11}"
+
     @log_on_start(DEBUG, "{name:s}: Starting to create printer")
     @log_on_error(DEBUG, "{name:s}: Encountered an error while creating printer")
     @log_on_end(DEBUG, "{name:s}: Finished creating printer")
@@ -292,54 +1710,1630 @@ class Printer(Consumer):
                  delay=0,  # how many seconds to sleep for between printing data
                  termination_buses=Bus(False, "Default printer termination bus"),  # buses to check for termination
                  name="Unnamed termination timer",  # name of this printer
-                 print_prefix="Unspecified printer: "):  # prefix for output
+                 print_prefix="Unspecified printer: ",  # prefix for output
+                 on_change=False,  # only print when the messages have changed
+                 queue_size=16,  # lines that can wait for the writer thread
+                 overflow="coalesce",  # "coalesce" or "drop" lines when the queue is full
+                 output=None,  # file-like object to print to (default: standard output)
+                 **kwargs):  # keyword options of ConsumerProducer
 
         super().__init__(
             self.print_bus,  # Printer class defines its own printing function
             printer_bus,
             delay,
             termination_buses,
-            name)
+            name,
+            **kwargs)
+
+        if overflow not in ("coalesce", "drop"):
+            raise ValueError("overflow must be 'coalesce' or 'drop'")
 
         self.print_prefix = print_prefix
+        self.on_change = on_change
+        self.overflow = overflow
+        self.output = output
+
+        # Output templates, keyed by which messages are numbers
+        self.templates = {}
+        self.printed_messages = None
+
+        self.line_queue = queue.Queue(queue_size)
+        self.writer = None
+        self.writer_stop = threading.Event()
+        self.dropped_lines = 0
+
+    def attachListeners(self, wake):
+
+        super().attachListeners(wake)
+
+        self.writer_stop.clear()
+        self.writer = threading.Thread(target=self.writeLines, name=self.name + " writer", daemon=True)
+        self.writer.start()
+
+    def detachListeners(self, wake):
+
+        super().detachListeners(wake)
+
+        # Let the writer finish the lines already queued, then stop it. The sentinel is only a wake-up for
+        # a writer waiting on an empty queue; if the queue is full the writer stops by itself once it has
+        # emptied it, so a stalled output cannot hold up shutdown for more than a second (the writer is a
+        # daemon thread)
+        self.writer_stop.set()
+        try:
+            self.line_queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self.writer.join(1.0)
+        self.writer = None
 
     def print_bus(self, *messages):
-        output_string = self.print_prefix                  # Start the output string with the print prefix
-        for msg in messages:                               # Append bus messages to the output
 
-            if isinstance(msg, str):                       # If the message is a string, leave it as it is
-                msg_str = msg
-            else:                                          # If it's not a string, assume it's a number and convert it
-                msg_str = str("{0:.4g}".format(msg))       # Convert to string with 4 significant figures
-                if msg >= 0:                               # Append a space before the value if it is not negative
-                    msg_str = " " + msg_str
+        if self.on_change:
+            try:
+                if messages == self.printed_messages:
+                    return
+            except ValueError:
+                pass  # array messages cannot be compared as a whole; treat them as changed
+            self.printed_messages = messages
+
+        kinds = tuple(isinstance(msg, numbers.Number) for msg in messages)
+        template = self.templates.get(kinds)
+        if template is None:
+            prefix = self.print_prefix.replace("{", "{{").replace("}", "}}")
+            template = self.templates[kinds] = prefix + "".join(
+                self.number_column if is_number else self.text_column for is_number in kinds)
+
+        self.emit(template.format(*messages))
+
+    def emit(self, line):
+        """
+        Queue a line for the writer thread, or print it directly if the printer is not running
+        """
+
+        if self.writer is None:
+            print(line, file=self.output)
+            return
+
+        try:
+            self.line_queue.put_nowait(line)
+        except queue.Full:
+            if self.overflow == "drop":
+                self.dropped_lines += 1
+                return
+            # Throw away the lines still waiting and queue the newest one in their place
+            while True:
+                try:
+                    self.line_queue.get_nowait()
+                    self.dropped_lines += 1
+                except queue.Empty:
+                    break
+            try:
+                self.line_queue.put_nowait(line)
+            except queue.Full:
+                self.dropped_lines += 1
+
+    def writeLines(self):
+        # Writer thread: print queued lines until the None sentinel arrives, or until the queue is empty
+        # after the printer has been stopped
+        while True:
+            line = self.line_queue.get()
+            if line is None:
+                break
+            print(line, file=self.output, flush=True)
+            if self.writer_stop.is_set() and self.line_queue.empty():
+                break
+
+
+class Watchdog(Consumer):
+    """
+    Watchdog is a node that checks, every delay seconds (or on a fixed period, with period=...), how long
+    ago each watched bus was last written, using the buses' write timestamps. A bus that has gone longer
+    than its deadline without a write is stale: the watchdog then writes the names of all currently
+    stale buses to its fault bus (and writes again whenever that set changes, so an empty tuple means all
+    clear), calls its reaction functions (such as Picarx.stop), writes True to its fault termination bus
+    if it has one, and counts the fault. The watched buses are never read or waited on, so a producer
+    stalled inside a write or a hardware call cannot hold the watchdog up, and a stall is acted on at
+    most one watchdog period after its deadline passes
+    """
+
+    closes_traces = False
+
+    @log_on_start(DEBUG, "{name:s}: Starting to create watchdog")
+    @log_on_error(DEBUG, "{name:s}: Encountered an error while creating watchdog")
+    @log_on_end(DEBUG, "{name:s}: Finished creating watchdog")
+    def __init__(self,
+                 watched_buses,  # bus or tuple of buses that must keep being written
+                 deadlines=0.5,  # longest time without a write, in seconds: one value, or a tuple per bus
+                 fault_bus=None,  # bus that receives the tuple of names of the stale buses, or None
+                 reaction=(),  # function or tuple of functions (no arguments) to call when a bus goes stale
+                 delay=0.05,  # how many seconds between checks
+                 termination_buses=Bus(False, "Default watchdog termination bus"),
+                 name="Unnamed watchdog",
+                 fault_termination_bus=None,  # bus to write True to when a bus goes stale, e.g. to stop the graph
+                 **kwargs):  # keyword options of ConsumerProducer
+
+        super().__init__(
+            self.check,  # Watchdog class defines its own checking function
+            (),  # the watched buses are not read
+            delay,
+            termination_buses,
+            name,
+            **kwargs)
+
+        self.watched_buses = ensureTuple(watched_buses)
+        if isinstance(deadlines, tuple):
+            if len(deadlines) != len(self.watched_buses):
+                raise ValueError("{:s}: deadlines must give one deadline per watched bus".format(name))
+            self.deadlines = deadlines
+        else:
+            self.deadlines = (deadlines,) * len(self.watched_buses)
+
+        self.fault_bus = fault_bus
+        self.reactions = reaction if isinstance(reaction, tuple) else (reaction,)
+        self.fault_termination_bus = fault_termination_bus
+
+        # Names of the buses found stale at the last check, and how many times each has gone stale
+        self.stale = ()
+        self.fault_count = 0
+        self.stale_counts = {bus.name: 0 for bus in self.watched_buses}
+
+        # Buses are judged from the later of their last write and the start of the watch, so that time
+        # spent building the graph does not count against them
+        self.t_watch = time.monotonic()
+
+    def attachListeners(self, wake):
+
+        super().attachListeners(wake)
+        self.t_watch = time.monotonic()
+
+    def check(self):
+        """
+        Find the stale buses, and publish and react to any change
+        """
+
+        now = time.monotonic()
+        stale = tuple(bus.name for bus, deadline in zip(self.watched_buses, self.deadlines)
+                      if now - max(bus.timestamp, self.t_watch) > deadline)
+
+        if stale == self.stale:
+            return
+
+        newly_stale = [bus_name for bus_name in stale if bus_name not in self.stale]
+        self.stale = stale
+
+        if self.fault_bus is not None:
+            self.fault_bus.set_message(stale, self.name)
+
+        if newly_stale:
+            self.fault_count += 1
+            for bus_name in newly_stale:
+                self.stale_counts[bus_name] += 1
+            logger.warning("{:s}: no write within the deadline on {:s}".format(self.name, ", ".join(newly_stale)))
+
+            for reaction in self.reactions:
+                try:
+                    reaction()
+                except Exception as error:
+                    logger.error("{:s}: fault reaction {!r} failed: {}".format(self.name, reaction, error))
+
+            if self.fault_termination_bus is not None:
+                self.fault_termination_bus.set_message(True, self.name)
+
+
+# Binary bus log format: a header naming the recorded buses, followed by one record per bus write.
+# Each record is a fixed-size struct (write time in seconds since the recording started, bus number,
+# payload type, payload length) followed by the payload bytes
+LOG_MAGIC = b"RRLOG1\n"
+LOG_RECORD = struct.Struct("<dHBI")
+
+# Payload types
+PAYLOAD_NONE, PAYLOAD_BOOL, PAYLOAD_INT, PAYLOAD_FLOAT, PAYLOAD_LIST, PAYLOAD_TUPLE, PAYLOAD_NDARRAY, \
+    PAYLOAD_STR, PAYLOAD_PICKLE, PAYLOAD_INT_LIST, PAYLOAD_INT_TUPLE, PAYLOAD_BOOL_LIST, \
+    PAYLOAD_BOOL_TUPLE = range(13)
+
+# Struct format of one element of each list and tuple payload type
+SEQUENCE_FORMATS = {PAYLOAD_LIST: "d", PAYLOAD_TUPLE: "d",
+                    PAYLOAD_INT_LIST: "q", PAYLOAD_INT_TUPLE: "q",
+                    PAYLOAD_BOOL_LIST: "?", PAYLOAD_BOOL_TUPLE: "?"}
+
+
+def sequenceKind(message):
+    """
+    Payload type for a list or tuple whose elements are all bools, all ints that fit in 64 bits, or all
+    ints and floats, or None if it needs to be pickled to keep its element types
+    """
+
+    is_list = isinstance(message, list)
+    if message and all(isinstance(v, bool) for v in message):
+        return PAYLOAD_BOOL_LIST if is_list else PAYLOAD_BOOL_TUPLE
+    if any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in message):
+        return None
+    if message and all(isinstance(v, int) and -2 ** 63 <= v < 2 ** 63 for v in message):
+        return PAYLOAD_INT_LIST if is_list else PAYLOAD_INT_TUPLE
+    return PAYLOAD_LIST if is_list else PAYLOAD_TUPLE
+
+
+def encodePayload(message):
+    """
+    Encode a bus message for the binary log, returning (payload type, payload bytes). Numbers, lists and
+    tuples of numbers or bools, NumPy arrays and strings get compact struct or raw-array encodings that
+    keep their types (a list of ints is only stored as floats if it also holds floats); anything else is
+    pickled
+    """
+
+    kind = sequenceKind(message) if isinstance(message, (list, tuple)) else None
+
+    if message is None:
+        return PAYLOAD_NONE, b""
+    elif isinstance(message, bool):
+        return PAYLOAD_BOOL, struct.pack("<?", message)
+    elif isinstance(message, int) and -2 ** 63 <= message < 2 ** 63:
+        return PAYLOAD_INT, struct.pack("<q", message)
+    elif isinstance(message, float):
+        return PAYLOAD_FLOAT, struct.pack("<d", message)
+    elif kind is not None:
+        return kind, struct.pack("<{:d}{:s}".format(len(message), SEQUENCE_FORMATS[kind]), *message)
+    elif np is not None and isinstance(message, np.ndarray) and message.dtype.kind in "biuf":
+        # dtype string and shape, then the raw array data
+        dtype = message.dtype.str.encode()
+        header = struct.pack("<B", len(dtype)) + dtype + struct.pack("<B{:d}I".format(message.ndim),
+                                                                       message.ndim, *message.shape)
+        return PAYLOAD_NDARRAY, header + np.ascontiguousarray(message).tobytes()
+    elif isinstance(message, str):
+        return PAYLOAD_STR, message.encode()
+    else:
+        return PAYLOAD_PICKLE, pickle.dumps(message)
+
+
+def decodePayload(kind, data):
+    """
+    Decode a payload written by encodePayload
+    """
+
+    if kind == PAYLOAD_NONE:
+        return None
+    elif kind == PAYLOAD_BOOL:
+        return struct.unpack("<?", data)[0]
+    elif kind == PAYLOAD_INT:
+        return struct.unpack("<q", data)[0]
+    elif kind == PAYLOAD_FLOAT:
+        return struct.unpack("<d", data)[0]
+    elif kind in SEQUENCE_FORMATS:
+        element_format = SEQUENCE_FORMATS[kind]
+        values = struct.unpack("<{:d}{:s}".format(len(data) // struct.calcsize(element_format), element_format),
+                               data)
+        return list(values) if kind in (PAYLOAD_LIST, PAYLOAD_INT_LIST, PAYLOAD_BOOL_LIST) else values
+    elif kind == PAYLOAD_NDARRAY:
+        dtype_length = data[0]
+        dtype = data[1:1 + dtype_length].decode()
+        ndim = data[1 + dtype_length]
+        shape = struct.unpack_from("<{:d}I".format(ndim), data, 2 + dtype_length)
+        return np.frombuffer(data, dtype=dtype, offset=2 + dtype_length + 4 * ndim).reshape(shape)
+    elif kind == PAYLOAD_STR:
+        return data.decode()
+    else:
+        return pickle.loads(data)
+
+
+def readBusLog(filename):
+    """
+    Read a binary bus log written by a Recorder, returning the list of recorded bus names and a list of
+    (time since the recording started, bus name, message) records in the order they were written
+    """
+
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    if not data.startswith(LOG_MAGIC):
+        raise ValueError("{:s} is not a RossROS bus log".format(filename))
+    offset = len(LOG_MAGIC)
+
+    # Header: number of buses, then the length and UTF-8 bytes of each bus name
+    (n_buses,) = struct.unpack_from("<H", data, offset)
+    offset += 2
+    bus_names = []
+    for _ in range(n_buses):
+        (length,) = struct.unpack_from("<H", data, offset)
+        bus_names.append(data[offset + 2:offset + 2 + length].decode())
+        offset += 2 + length
+
+    records = []
+    while offset + LOG_RECORD.size <= len(data):
+        t, bus_id, kind, length = LOG_RECORD.unpack_from(data, offset)
+        offset += LOG_RECORD.size
+        records.append((t, bus_names[bus_id], decodePayload(kind, data[offset:offset + length])))
+        offset += length
+
+    return bus_names, records
+
+
+class Recorder(Consumer):
+    """
+    Recorder is a consumer that logs every write to a set of buses into a compact binary file (see
+    readBusLog for reading it back). Writes are captured by listeners as they happen, without waiting for
+    the recorder's own cycle, and queued in memory; every delay seconds the recorder's thread encodes the
+    queued writes and appends them to the file in one block, so the writing nodes only pay for queueing
+    """
+
+    closes_traces = False
+
+    @log_on_start(DEBUG, "{name:s}: Starting to create recorder")
+    @log_on_error(DEBUG, "{name:s}: Encountered an error while creating recorder")
+    @log_on_end(DEBUG, "{name:s}: Finished creating recorder")
+    def __init__(self,
+                 recorded_buses,  # bus or tuple of buses whose writes should be logged
+                 filename,  # file to write the log to (overwritten)
+                 delay=0.5,  # how many seconds to wait between flushes to the file
+                 termination_buses=Bus(False, "Default recorder termination bus"),
+                 name="Unnamed recorder",
+                 **kwargs):  # keyword options of ConsumerProducer
+
+        super().__init__(
+            self.flush,  # Recorder class defines its own flushing function
+            recorded_buses,
+            delay,
+            termination_buses,
+            name,
+            **kwargs)
+
+        self.filename = filename
+        self.file = None
+        self.queue = collections.deque()
+        self.t_start = 0.0
+        self.capture_listeners = ()
+
+    def attachListeners(self, wake):
+
+        super().attachListeners(wake)
+
+        # Open the log and write the header
+        self.file = open(self.filename, "wb")
+        header = [LOG_MAGIC, struct.pack("<H", len(self.input_buses))]
+        for bus in self.input_buses:
+            name = bus.name.encode()
+            header.append(struct.pack("<H", len(name)) + name)
+        self.file.write(b"".join(header))
+        self.t_start = time.monotonic()
+
+        # Capture each write, with the message it wrote, from the writing thread; deque appends are
+        # thread-safe
+        def captureWrite(bus_id):
+            def listener(timestamp, message):
+                self.queue.append((timestamp, bus_id, snapshot(message)))
+            return listener
+
+        self.capture_listeners = tuple(captureWrite(idx) for idx in range(len(self.input_buses)))
+        for bus, listener in zip(self.input_buses, self.capture_listeners):
+            bus.add_write_listener(listener)
+
+    def detachListeners(self, wake):
+
+        for bus, listener in zip(self.input_buses, self.capture_listeners):
+            bus.remove_write_listener(listener)
+
+        super().detachListeners(wake)
+
+        # Write out whatever is still queued and close the log
+        self.flush()
+        self.file.close()
+
+    def flush(self, *_messages):
+        """
+        Encode the queued writes and append them to the log in one block
+        """
+
+        chunks = []
+        for _ in range(len(self.queue)):
+            timestamp, bus_id, message = self.queue.popleft()
+            kind, payload = encodePayload(message)
+            chunks.append(LOG_RECORD.pack(timestamp - self.t_start, bus_id, kind, len(payload)))
+            chunks.append(payload)
+
+        if chunks:
+            self.file.write(b"".join(chunks))
+            self.file.flush()
+
+
+class ReplayProducer(Producer):
+    """
+    ReplayProducer feeds a log written by a Recorder back into buses, reproducing the recorded writes in
+    order and with their original spacing divided by speed (speed=None replays as fast as possible). Each
+    recorded write goes to the bus of the same name among replay_buses; writes to other buses are skipped.
+    Like a Timer, its output bus receives -1 while the replay runs and 1 once it has finished, so it can
+    serve as a termination bus for the graph under test. After writing the 1, the replay producer stops
+    """
+
+    @log_on_start(DEBUG, "{name:s}: Starting to create replay producer")
+    @log_on_error(DEBUG, "{name:s}: Encountered an error while creating replay producer")
+    @log_on_end(DEBUG, "{name:s}: Finished creating replay producer")
+    def __init__(self,
+                 filename,  # log written by a Recorder
+                 replay_buses,  # bus or tuple of buses to write the recorded messages into
+                 output_buses=Bus(0, "Default replay progress bus"),  # buses that receive -1 / 1
+                 speed=1.0,  # replay speed relative to the recording, or None for as fast as possible
+                 termination_buses=Bus(False, "Default replay termination bus"),
+                 name="Unnamed replay producer",
+                 **kwargs):  # keyword options of ConsumerProducer
+
+        super().__init__(
+            self.replay,  # ReplayProducer class defines its own producer function
+            output_buses,
+            0,  # the delay is recalculated after every cycle to wait for the next recorded write
+            termination_buses,
+            name,
+            **kwargs)
+
+        self.bus_names, self.records = readBusLog(filename)
+        self.replay_buses = {bus.name: bus for bus in ensureTuple(replay_buses)}
+        self.speed = speed
+        self.next_record = 0
+        self.t_start = None
+
+    def replay(self):
+
+        now = time.monotonic()
+        if self.t_start is None:
+            self.t_start = now
+
+        # Log time that has been reached so far
+        log_time = (now - self.t_start) * self.speed if self.speed else float("inf")
+
+        # Write every record that has come due
+        while self.next_record < len(self.records) and self.records[self.next_record][0] <= log_time:
+            _t, bus_name, message = self.records[self.next_record]
+            bus = self.replay_buses.get(bus_name)
+            if bus is not None:
+                bus.set_message(message, self.name)
+            self.next_record += 1
+
+        if self.next_record >= len(self.records):
+            # The 1 is still written to the output buses; the node then stops instead of spinning
+            self.terminate()
+            return 1
+
+        # Sleep until the next record is due
+        if self.speed:
+            self.delay = max(0.0, self.t_start + self.records[self.next_record][0] / self.speed - time.monotonic())
+        return -1
+
+
+# Bus bridge framing: each frame is a FRAME_HEADER (frame type, body length) followed by the body. A hello
+# body lists the names of the buses the sender will forward (as in the bus log header); an updates body is
+# a record count followed by that many LOG_RECORD records (write time, index into the sender's hello list,
+# payload type, payload length), each followed by its payload
+FRAME_HEADER = struct.Struct("<BI")
+FRAME_HELLO, FRAME_UPDATES = range(2)
+
+# Errors raised by a malformed or refused frame; the bridge drops the connection rather than its link thread
+FRAME_ERRORS = (ValueError, TypeError, IndexError, KeyError, EOFError, struct.error, zlib.error,
+                pickle.UnpicklingError)
+
+
+def recvExactly(sock, n):
+    """
+    Read exactly n bytes from a socket, returning None if the connection closes first
+    """
+
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+class BusBridge(Consumer):
+    """
+    BusBridge mirrors buses between processes over a Unix domain socket. Each process runs a bridge with
+    the same address, one as the "server" (which listens on the socket path) and one as the "client" (which
+    connects to it). A bridge forwards writes to its outgoing buses, and writes what it receives from the
+    other side into its incoming buses of the same name, so that a bus should be outgoing on one side
+    only. Writes are coalesced: listeners mark the outgoing buses that have been written, and every delay
+    seconds (the flush tick) the latest message of each marked bus is sent, all in one frame. A receiver
+    thread writes incoming messages to the local buses as they arrive and records their one-way latency
+    (both sides use time.monotonic(), which is shared by processes on the same machine). If the
+    connection drops, the client reconnects every reconnect_interval seconds and the server accepts the
+    next connection; all outgoing buses are resent on every new connection. A malformed frame, or one
+    longer than max_frame, drops the connection
+    """
+
+    closes_traces = False
+
+    # Socket family; the address is a filesystem path for Unix domain sockets
+    family = socket.AF_UNIX
+
+    @log_on_start(DEBUG, "{name:s}: Starting to create bus bridge")
+    @log_on_error(DEBUG, "{name:s}: Encountered an error while creating bus bridge")
+    @log_on_end(DEBUG, "{name:s}: Finished creating bus bridge")
+    def __init__(self,
+                 address,  # socket path (or address, for subclasses using other socket families)
+                 outgoing_buses=(),  # bus or tuple of buses whose writes are sent to the other side
+                 incoming_buses=(),  # bus or tuple of buses that receive the other side's writes
+                 role="client",  # "server" listens on the address, "client" connects to it
+                 delay=0.01,  # flush tick: how many seconds between sends
+                 termination_buses=Bus(False, "Default bus bridge termination bus"),
+                 name="Unnamed bus bridge",
+                 reconnect_interval=0.5,  # seconds between connection attempts by a client
+                 max_frame=16 * 2 ** 20,  # largest frame body, in bytes, accepted from the other side
+                 **kwargs):  # keyword options of ConsumerProducer
+
+        if role not in ("server", "client"):
+            raise ValueError("role must be 'server' or 'client'")
+
+        super().__init__(
+            self.flush,  # BusBridge class defines its own flushing function
+            outgoing_buses,
+            delay,
+            termination_buses,
+            name,
+            **kwargs)
+
+        self.address = address
+        self.role = role
+        self.reconnect_interval = reconnect_interval
+        self.max_frame = max_frame
+        self.incoming_buses = {bus.name: bus for bus in ensureTuple(incoming_buses)}
+
+        # Indices of the outgoing buses written since the last flush
+        self.dirty = set()
+        self.dirty_listeners = ()
+
+        # Current connection (None while disconnected), guarded by send_lock for sending and replacing it
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.connected = threading.Event()
+        self.stop_event = threading.Event()
+        self.link = None
+
+        # Link statistics
+        self.connect_count = 0
+        self.frames_sent = 0
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.latency_histogram = Histogram()
+        self.last_received = 0.0
+
+    def attachListeners(self, wake):
+
+        super().attachListeners(wake)
+
+        # Mark outgoing buses as they are written; set.add is atomic
+        def markDirty(bus_id):
+            def listener():
+                self.dirty.add(bus_id)
+            return listener
+
+        self.dirty_listeners = tuple(markDirty(idx) for idx in range(len(self.input_buses)))
+        for bus, listener in zip(self.input_buses, self.dirty_listeners):
+            bus.add_listener(listener)
+
+        self.stop_event.clear()
+        self.link = threading.Thread(target=self.runLink, name=self.name + " link", daemon=True)
+        self.link.start()
+
+    def detachListeners(self, wake):
+
+        for bus, listener in zip(self.input_buses, self.dirty_listeners):
+            bus.remove_listener(listener)
+
+        super().detachListeners(wake)
+
+        # Send whatever is still pending, then close the connection and stop the link thread
+        self.flush()
+        self.stop_event.set()
+        self.disconnect()
+        self.link.join(2 * self.reconnect_interval + 1.0)
+
+    def openSocket(self):
+        """
+        Create a socket for the bridge's address family
+        """
+
+        return socket.socket(self.family, socket.SOCK_STREAM)
+
+    def listen(self):
+        """
+        Create the server's listening socket, replacing a stale socket file left by an earlier run
+        """
+
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        server = self.openSocket()
+        server.bind(self.address)
+        server.listen(1)
+        return server
+
+    def closeListener(self, server):
+        """
+        Close the server's listening socket and remove its socket file
+        """
+
+        server.close()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def connect(self, server):
+        """
+        Wait for a connection (accepting one as the server, or connecting as the client), returning the
+        connected socket, or None if the bridge is stopped first
+        """
+
+        while not self.stop_event.is_set():
+            try:
+                if server is not None:
+                    sock, _peer = server.accept()
+                else:
+                    sock = self.openSocket()
+                    try:
+                        sock.connect(self.address)
+                    except OSError:
+                        sock.close()
+                        raise
+                return sock
+            except socket.timeout:
+                continue
+            except OSError:
+                self.stop_event.wait(self.reconnect_interval)
+        return None
+
+    def runLink(self):
+        """
+        Link thread: keep a connection open, say hello and resend the outgoing buses on each new connection,
+        and receive the other side's frames until the connection drops
+        """
+
+        server = None
+        if self.role == "server":
+            server = self.listen()
+            server.settimeout(self.reconnect_interval)
+
+        try:
+            while not self.stop_event.is_set():
+                sock = self.connect(server)
+                if sock is None:
+                    break
+                self.onConnect(sock)
+
+                try:
+                    self.receiveFrames(sock)
+                except OSError:
+                    pass
+                except FRAME_ERRORS as error:
+                    logger.warning("{:s}: dropping the link after a bad frame: {!r}".format(self.name, error))
+
+                self.disconnect()
+        finally:
+            if server is not None:
+                self.closeListener(server)
+
+    def onConnect(self, sock):
+        """
+        Start using a new connection: send the hello frame and mark every outgoing bus for resending
+        """
+
+        names = [struct.pack("<H", len(self.input_buses))]
+        for bus in self.input_buses:
+            name = bus.name.encode()
+            names.append(struct.pack("<H", len(name)) + name)
+        hello = b"".join(names)
+
+        with self.send_lock:
+            sock.sendall(FRAME_HEADER.pack(FRAME_HELLO, len(hello)) + hello)
+            self.sock = sock
+            self.connect_count += 1
+        self.dirty.update(range(len(self.input_buses)))
+        self.connected.set()
+
+    def disconnect(self):
+        """
+        Close the current connection, if any, returning True if there was one
+        """
+
+        self.connected.clear()
+        with self.send_lock:
+            sock, self.sock = self.sock, None
+        if sock is None:
+            return False
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+        return True
+
+    def receiveFrames(self, sock):
+        """
+        Read frames from a connection until it closes, writing received messages into the incoming buses
+        """
+
+        # Local bus for each index of the other side's hello list (None for buses not mirrored here)
+        remote_buses = []
+
+        while not self.stop_event.is_set():
+            header = recvExactly(sock, FRAME_HEADER.size)
+            if header is None:
+                return
+            frame_type, length = FRAME_HEADER.unpack(header)
+            if length > self.max_frame:
+                # Refuse the frame before reading it, rather than allocating whatever length the peer sent
+                raise ValueError("frame of {:d} bytes is larger than max_frame".format(length))
+            body = recvExactly(sock, length)
+            if body is None:
+                return
+            received = time.monotonic()
+            self.last_received = received
+
+            if frame_type == FRAME_HELLO:
+                remote_buses = self.parseHello(body)
+            elif frame_type == FRAME_UPDATES:
+                for timestamp, bus_id, message in self.parseUpdates(body):
+                    bus = remote_buses[bus_id] if bus_id < len(remote_buses) else None
+                    if bus is not None:
+                        bus.set_message(message, self.name)
+                        self.messages_received += 1
+                        self.latency_histogram.record(max(0.0, received - timestamp))
+            else:
+                self.onFrame(frame_type, body)
+
+    def parseHello(self, body):
+        """
+        Match the bus names in a hello frame to the incoming buses
+        """
+
+        (n_buses,) = struct.unpack_from("<H", body, 0)
+        offset = 2
+        buses = []
+        for _ in range(n_buses):
+            (length,) = struct.unpack_from("<H", body, offset)
+            buses.append(self.incoming_buses.get(body[offset + 2:offset + 2 + length].decode()))
+            offset += 2 + length
+        return buses
+
+    def parseUpdates(self, body):
+        """
+        Decode the (write time, bus index, message) records of an updates frame
+        """
+
+        (count,) = struct.unpack_from("<H", body, 0)
+        offset = 2
+        records = []
+        for _ in range(count):
+            timestamp, bus_id, kind, length = LOG_RECORD.unpack_from(body, offset)
+            offset += LOG_RECORD.size
+            records.append((timestamp, bus_id, self.decodeMessage(kind, body[offset:offset + length])))
+            offset += length
+        return records
+
+    def encodeMessage(self, message):
+        """
+        Encode an outgoing message, returning (payload type, payload bytes)
+        """
+
+        return encodePayload(message)
+
+    def decodeMessage(self, kind, data):
+        """
+        Decode an incoming payload
+        """
+
+        return decodePayload(kind, data)
+
+    def onFrame(self, frame_type, body):
+        """
+        Handle a frame type that this class does not know about; subclasses extend the protocol here
+        """
+
+        pass
+
+    def sendFrame(self, frame_type, body):
+        """
+        Send one frame on the current connection, returning False if there is none or sending failed
+        """
+
+        with self.send_lock:
+            sock = self.sock
+            if sock is None:
+                return False
+            try:
+                sock.sendall(FRAME_HEADER.pack(frame_type, len(body)) + body)
+            except OSError:
+                return False
+            self.frames_sent += 1
+        return True
+
+    def flush(self, *_messages):
+        """
+        Send the latest message of each outgoing bus written since the last flush, in a single frame
+        """
+
+        if not self.dirty or not self.connected.is_set():
+            return
+
+        # Take the marked buses; a bus marked again while sending is sent at the next flush
+        bus_ids = sorted(self.dirty)
+        self.dirty.difference_update(bus_ids)
+
+        chunks = [struct.pack("<H", len(bus_ids))]
+        for bus_id in bus_ids:
+            bus = self.input_buses[bus_id]
+            timestamp, message = bus.timestamp, bus.message
+            kind, payload = self.encodeMessage(message)
+            chunks.append(LOG_RECORD.pack(timestamp, bus_id, kind, len(payload)))
+            chunks.append(payload)
+
+        if self.sendFrame(FRAME_UPDATES, b"".join(chunks)):
+            self.messages_sent += len(bus_ids)
+        else:
+            # Not sent; resend these buses once the connection is back
+            self.dirty.update(bus_ids)
+
+    def link_stats(self):
+        """
+        Return a dictionary of link statistics: connections made, frames and messages sent and received,
+        and the one-way latency of received messages in seconds
+        """
+
+        return {"connects": self.connect_count,
+                "frames_sent": self.frames_sent,
+                "messages_sent": self.messages_sent,
+                "messages_received": self.messages_received,
+                "latency": self.latency_histogram.summary()}
+
+
+# Further bridge frame types used by TCPBusBridge: a heartbeat carries the sender's time.monotonic() and
+# is answered with an acknowledgement echoing it, from which the sender measures the round-trip time
+FRAME_HEARTBEAT, FRAME_HEARTBEAT_ACK = range(2, 4)
+HEARTBEAT = struct.Struct("<d")
+
+# Flag added to the payload type of a zlib-compressed payload
+PAYLOAD_COMPRESSED = 0x80
+
+
+class TCPBusBridge(BusBridge):
+    """
+    BusBridge over TCP, for running nodes such as planners or logging sinks on another machine. The
+    address is a (host, port) pair. On top of the coalesced, one-frame-per-flush batching of BusBridge,
+    payloads of NumPy arrays and lists or tuples of numbers larger than compress_threshold bytes can be
+    zlib-compressed. Each side sends a heartbeat every heartbeat_interval seconds; a link that has
+    received nothing (not even a heartbeat) for stale_timeout seconds is treated as dropped and
+    reconnected. When the link goes down, the fallback policy is applied to the incoming buses: fallback
+    maps incoming bus names to a message (or a function of no arguments returning one) to write, such as a
+    zero steering command, so that local nodes do not keep acting on the last remote value. The
+    one-way latency statistics assume a shared clock and are only meaningful with both ends on one machine;
+    the round-trip times in rtt_histogram are always valid (rr_benchmark.LatencyShim simulates a slow or
+    broken link on one machine). Payloads that could only be sent pickled are
+    refused (and the connection dropped) unless allow_pickle is set, since unpickling data from the network
+    can run arbitrary code; only enable it for a trusted peer on a trusted network
+    """
+
+    family = socket.AF_INET
+
+    @log_on_start(DEBUG, "{name:s}: Starting to create TCP bus bridge")
+    @log_on_error(DEBUG, "{name:s}: Encountered an error while creating TCP bus bridge")
+    @log_on_end(DEBUG, "{name:s}: Finished creating TCP bus bridge")
+    def __init__(self,
+                 address,  # (host, port) to listen on as the server or connect to as the client
+                 outgoing_buses=(),
+                 incoming_buses=(),
+                 role="client",
+                 delay=0.02,  # flush tick: how many seconds between sends
+                 termination_buses=Bus(False, "Default TCP bus bridge termination bus"),
+                 name="Unnamed TCP bus bridge",
+                 compress_level=None,  # zlib level (1-9) for compressing array payloads, or None for none
+                 compress_threshold=256,  # smallest payload, in bytes, that is compressed
+                 heartbeat_interval=0.25,  # seconds between heartbeats
+                 stale_timeout=1.0,  # seconds without receiving anything before the link is dropped
+                 fallback=None,  # incoming bus name: message (or function returning one) for link loss
+                 allow_pickle=False,  # accept pickled payloads (unsafe unless the peer is trusted)
+                 **kwargs):  # keyword options of BusBridge and ConsumerProducer
+
+        super().__init__(address, outgoing_buses, incoming_buses, role, delay, termination_buses, name,
+                         **kwargs)
+
+        self.compress_level = compress_level
+        self.compress_threshold = compress_threshold
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_timeout = stale_timeout
+        self.fallback = fallback if fallback is not None else {}
+        self.allow_pickle = allow_pickle
+
+        self.last_heartbeat = 0.0
+        self.link_drop_count = 0
+        self.rtt_histogram = Histogram()
+
+    def openSocket(self):
+
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def listen(self):
+
+        server = self.openSocket()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(self.address)
+        server.listen(1)
+        return server
+
+    def closeListener(self, server):
+
+        server.close()
+
+    def encodeMessage(self, message):
+
+        kind, payload = encodePayload(message)
+        if self.compress_level is not None and (kind in SEQUENCE_FORMATS or kind == PAYLOAD_NDARRAY) \
+                and len(payload) >= self.compress_threshold:
+            return kind | PAYLOAD_COMPRESSED, zlib.compress(payload, self.compress_level)
+        return kind, payload
+
+    def decodeMessage(self, kind, data):
+
+        if kind & PAYLOAD_COMPRESSED:
+            kind &= ~PAYLOAD_COMPRESSED
+            # Decompressed payloads are held to the same limit as frames
+            decompressor = zlib.decompressobj()
+            data = decompressor.decompress(data, self.max_frame)
+            if decompressor.unconsumed_tail:
+                raise ValueError("compressed payload is larger than max_frame")
+        if kind == PAYLOAD_PICKLE and not self.allow_pickle:
+            raise ValueError("pickled payload refused (allow_pickle is not set)")
+        return decodePayload(kind, data)
+
+    def onConnect(self, sock):
+
+        # A new connection starts out fresh
+        self.last_received = time.monotonic()
+        super().onConnect(sock)
+
+    def onFrame(self, frame_type, body):
+
+        if frame_type == FRAME_HEARTBEAT:
+            self.sendFrame(FRAME_HEARTBEAT_ACK, body)
+        elif frame_type == FRAME_HEARTBEAT_ACK:
+            (sent,) = HEARTBEAT.unpack(body)
+            self.rtt_histogram.record(time.monotonic() - sent)
+
+    def is_stale(self):
+        """
+        True if the link is down or nothing has been received on it for stale_timeout seconds
+        """
+
+        return not self.connected.is_set() or time.monotonic() - self.last_received > self.stale_timeout
+
+    def staleness(self):
+        """
+        Return a dictionary of how many seconds ago each incoming bus was last written
+        """
+
+        now = time.monotonic()
+        return {name: now - bus.timestamp for name, bus in self.incoming_buses.items()}
+
+    def flush(self, *_messages):
+        """
+        Check the link's health, send a heartbeat if one is due, and send the pending bus updates
+        """
+
+        now = time.monotonic()
+
+        # Drop a stale connection, so that the link thread reconnects
+        if self.connected.is_set() and now - self.last_received > self.stale_timeout:
+            logger.warning("{:s}: no data for {:g} s, dropping the link".format(self.name, self.stale_timeout))
+            self.disconnect()
+
+        if self.connected.is_set() and now - self.last_heartbeat >= self.heartbeat_interval:
+            self.last_heartbeat = now
+            self.sendFrame(FRAME_HEARTBEAT, HEARTBEAT.pack(now))
+
+        super().flush()
+
+    def disconnect(self):
 
-            output_string = output_string + " " + msg_str  # Append the message string to the output string
+        # Apply the fallback policy once per lost connection, but not when the bridge is shutting down
+        dropped = super().disconnect()
+        if dropped and not self.stop_event.is_set():
+            self.link_drop_count += 1
+            self.applyFallback()
+        return dropped
 
-            for i in range(1, 12 - len(msg_str)):          # Add spacing to put the outputs into columns
-                output_string = output_string + " "
+    def applyFallback(self):
+        """
+        Write the fallback messages into their incoming buses
+        """
 
-        print(output_string)                               # Print the formatted output
+        for bus_name, message in self.fallback.items():
+            bus = self.incoming_buses.get(bus_name)
+            if bus is not None:
+                bus.set_message(message() if callable(message) else message, self.name)
+
+    def link_stats(self):
+
+        stats = super().link_stats()
+        stats["link_drops"] = self.link_drop_count
+        stats["rtt"] = self.rtt_histogram.summary()
+        return stats
+
+
+class RealtimeProfile:
+    """
+    Real-time settings for the thread running one node, applied by runConcurrently when the node starts:
+    cpus pins the thread to a set of cores (os.sched_setaffinity), and priority runs it under the
+    SCHED_FIFO policy at that priority (1-99), which needs root or CAP_SYS_NICE. Settings the platform or
+    the process's permissions do not allow are skipped with a warning, so the same graph still runs
+    """
+
+    def __init__(self,
+                 cpus=None,  # iterable of CPU numbers to pin the node's thread to, or None
+                 priority=None):  # SCHED_FIFO priority for the node's thread, or None
+
+        self.cpus = set(cpus) if cpus is not None else None
+        self.priority = priority
+
+    def apply(self, name):
+        """
+        Apply the profile to the calling thread (on Linux, pid 0 in the sched_* calls means the calling
+        thread rather than the whole process)
+        """
+
+        if self.cpus is not None:
+            try:
+                os.sched_setaffinity(0, self.cpus)
+            except (AttributeError, OSError) as error:
+                logger.warning("{:s}: could not pin to CPUs {}: {}".format(name, sorted(self.cpus), error))
+
+        if self.priority is not None:
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+            except (AttributeError, OSError) as error:
+                logger.warning("{:s}: could not set SCHED_FIFO priority {:d}: {}".format(name, self.priority, error))
+
+
+def runWithProfile(cp, profile):
+    """
+    Apply a node's real-time profile (if any) to the current thread, then run the node
+    """
+
+    if profile is not None:
+        profile.apply(cp.name)
+    cp()
+
+
+# Observed garbage collector pauses, per generation, recorded while a real-time run is in progress
+gc_pause_histograms = {}
+gc_pause_start = [0.0]
+
+
+def recordGCPause(phase, info):
+    """
+    gc.callbacks hook timing each collection
+    """
+
+    # Collections run with the interpreter lock held, so they cannot overlap
+    if phase == "start":
+        gc_pause_start[0] = time.perf_counter()
+    else:
+        generation = info["generation"]
+        if generation not in gc_pause_histograms:
+            gc_pause_histograms[generation] = Histogram()
+        gc_pause_histograms[generation].record(time.perf_counter() - gc_pause_start[0])
+
+
+def gcPauseReport():
+    """
+    Return a dictionary of generation: summary of the garbage collector pauses observed during real-time
+    runs, in seconds (see Histogram.summary)
+    """
+
+    return {generation: histogram.summary() for generation, histogram in sorted(gc_pause_histograms.items())}
 
 
 @log_on_start(DEBUG, "runConcurrently: Starting concurrent execution")
 @log_on_error(DEBUG, "runConcurrently: Encountered an error during concurrent execution")
 @log_on_end(DEBUG, "runConcurrently: Finished concurrent execution")
-def runConcurrently(producer_consumer_list):
+def runConcurrently(producer_consumer_list,
+                    placement=None,  # process number for each node (0 is this process), or None
+                    realtime=None,  # dictionary of node: RealtimeProfile, or None for a plain run
+                    disable_gen2=False):  # with realtime, suspend full (generation 2) collections
     """
     runConcurrently is aFunction that uses a concurrent.futures ThreadPoolExecutor to concurrently
     execute a set of ConsumerProducer functions
-    """
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(producer_consumer_list)) as executor:
 
-        # Create a list to hold the executors created from the provided functions
-        executor_list = []
+    If a placement is given, the nodes are split across processes: placement[i] is the number of the
+    process that runs producer_consumer_list[i], with 0 meaning the calling process and other numbers
+    meaning processes forked for the run (each of which runs its own nodes in threads). Buses used by
+    nodes in more than one process, including termination buses, are replaced in those nodes by
+    SharedBus copies, so they must carry numbers or fixed-size arrays of numbers
+
+    If realtime is given (even as an empty dictionary), each node listed in it has its RealtimeProfile
+    applied to its thread, and the garbage collector is prepared for the run: everything allocated while
+    building the graph is moved out of the collector's reach with gc.freeze(), so that collections during
+    the run only scan objects made since, and with disable_gen2 the full collections are suspended until
+    the run ends. The collector's pauses are timed throughout the run and logged afterwards (see
+    gcPauseReport)
+    """
 
-        # Loop over the list of provided functions, turning each into an executor for the thread pool
-        for cp in producer_consumer_list:
-            executor_list.append(executor.submit(cp))
+    if placement is not None:
+        runInProcesses(producer_consumer_list, placement, realtime, disable_gen2)
+        return
+
+    if realtime is not None:
+        gc.collect()
+        gc.freeze()
+        thresholds = gc.get_threshold()
+        if disable_gen2:
+            gc.set_threshold(thresholds[0], thresholds[1], 2 ** 31 - 1)
+        gc.callbacks.append(recordGCPause)
+    else:
+        realtime = {}
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(producer_consumer_list)) as executor:
+
+            # Create a list to hold the executors created from the provided functions
+            executor_list = []
+
+            # Loop over the list of provided functions, turning each into an executor for the thread pool
+            for cp in producer_consumer_list:
+                executor_list.append(executor.submit(runWithProfile, cp, realtime.get(cp)))
+    finally:
+        if recordGCPause in gc.callbacks:
+            gc.callbacks.remove(recordGCPause)
+            gc.set_threshold(*thresholds)
+            gc.unfreeze()
+            for generation, pauses in gcPauseReport().items():
+                logger.info("GC generation {:d}: {:d} pauses, p50 {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms".format(
+                    generation, pauses["count"], 1e3 * pauses["p50"], 1e3 * pauses["p99"], 1e3 * pauses["max"]))
 
     # Loop over the executors that were created above, running their result methods
     for e in executor_list:
-        e.result()
\ No newline at end of file
+        e.result()
+
+
+def shareCrossProcessBuses(producer_consumer_list, placement):
+    """
+    Replace every bus that is used by nodes placed in more than one process with a SharedBus, in all
+    of the nodes that use it. Returns the list of SharedBus objects that were created
+    """
+
+    # Find the processes that use each bus
+    bus_processes = {}
+    for cp, process in zip(producer_consumer_list, placement):
+        for bus in cp.input_buses + cp.output_buses + cp.termination_buses:
+            bus_processes.setdefault(id(bus), (bus, set()))[1].add(process)
+
+    # Make shared copies of the buses that cross process boundaries
+    replacements = {}
+    for bus, processes in bus_processes.values():
+        if len(processes) > 1 and not isinstance(bus, SharedBus):
+            replacements[id(bus)] = SharedBus.from_bus(bus)
+            logger.info("{:s}: moved to shared memory for use by processes {}".format(
+                bus.name, sorted(processes)))
+
+    def share(buses):
+        return tuple(replacements.get(id(bus), bus) for bus in buses)
+
+    for cp in producer_consumer_list:
+        cp.input_buses = share(cp.input_buses)
+        cp.output_buses = share(cp.output_buses)
+        cp.termination_buses = share(cp.termination_buses)
+
+    return list(replacements.values())
+
+
+def runProcessGroup(producer_consumer_list, realtime=None, disable_gen2=False):
+    """
+    Run the nodes placed in one process, together with a thread that watches the shared buses they use
+    for writes made by other processes and passes them on to this process's listeners, so that
+    termination, trigger and wait_for_input wake-ups work across processes
+    """
+
+    shared_buses = {id(bus): bus for cp in producer_consumer_list
+                    for bus in cp.input_buses + cp.output_buses + cp.termination_buses
+                    if isinstance(bus, SharedBus)}
+    stop_watching = threading.Event()
+    watcher = threading.Thread(target=watchSharedBuses, args=(list(shared_buses.values()), stop_watching),
+                               daemon=True)
+    watcher.start()
+
+    try:
+        runConcurrently(producer_consumer_list, realtime=realtime, disable_gen2=disable_gen2)
+    finally:
+        stop_watching.set()
+        watcher.join()
+
+
+def watchSharedBuses(buses, stop_event):
+    """
+    Poll the sequence numbers of a set of shared buses until stop_event is set, and notify the local
+    waiters and listeners of any bus that has been written
+    """
+
+    seqs = [bus.seq for bus in buses]
+    while not stop_event.wait(SharedBus.poll_interval):
+        for idx, bus in enumerate(buses):
+            seq = bus.seq
+            if seq != seqs[idx]:
+                seqs[idx] = seq
+                bus.notify_update(bus.message)
+
+
+def runInProcesses(producer_consumer_list, placement, realtime=None, disable_gen2=False):
+    """
+    Run a set of ConsumerProducer functions split across processes according to placement, see
+    runConcurrently
+    """
+
+    if len(placement) != len(producer_consumer_list):
+        raise ValueError("placement must give a process number for every node")
+
+    shared_buses = shareCrossProcessBuses(producer_consumer_list, placement)
+
+    # Group the nodes by process
+    groups = {}
+    for cp, process in zip(producer_consumer_list, placement):
+        groups.setdefault(process, []).append(cp)
+
+    # Nodes usually hold hardware objects that cannot be pickled, so the processes are forked
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=runProcessGroup, args=(nodes, realtime, disable_gen2),
+                                 name="rossros process {}".format(p))
+                 for p, nodes in groups.items() if p != 0]
+
+    try:
+        for process in processes:
+            process.start()
+
+        if 0 in groups:
+            runProcessGroup(groups[0], realtime, disable_gen2)
+
+        for process in processes:
+            process.join()
+    finally:
+        for bus in shared_buses:
+            bus.close()
+
+    failed = [process.name for process in processes if process.exitcode != 0]
+    if failed:
+        raise RuntimeError("runConcurrently: {} exited with an error".format(", ".join(failed)))
+
+
+class AsyncNode:
+    """
+    Adapter that runs an existing ConsumerProducer (or Producer, Consumer, Timer, Printer) as a coroutine
+    on an asyncio event loop, with the same termination, delay, period and wait_for_input behaviour as its
+    threaded __call__. Sleeps and waits become awaits, so many nodes can share one thread. A node marked
+    blocking (e.g. one whose function reads the ultrasonic sensor) runs its cycles in a thread pool instead,
+    so that it does not stall the event loop
+    """
+
+    def __init__(self,
+                 node,  # ConsumerProducer to run
+                 blocking=False):  # run the node's cycles in the executor rather than on the loop
+
+        self.node = node
+        self.blocking = blocking
+        self.name = node.name
+
+    async def __call__(self, executor):
+
+        node = self.node
+        loop = asyncio.get_running_loop()
+
+        # Writes to the watched buses and termination (which may come from any thread) set the wake
+        # event on this loop; termination also sets the stop event that the node's sleeps wait on
+        wake_event = asyncio.Event()
+        stop_event = asyncio.Event()
+
+        def wake():
+            loop.call_soon_threadsafe(wake_event.set)
+            if node.termination_signal.is_set():
+                loop.call_soon_threadsafe(stop_event.set)
+
+        node.attachListeners(wake)
+
+        try:
+            if node.checkTerminationbuses():
+                node.terminate()
+
+            release = time.monotonic()
+
+            while not node.termination_signal.is_set():
+
+                if node.period is not None:
+                    node.recordRelease(release)
+
+                wake_event.clear()
+                cycle_start = time.monotonic()
+
+                if self.blocking:
+                    input_seqs = await loop.run_in_executor(executor, node.runCycle)
+                else:
+                    input_seqs = node.runCycle()
+
+                if node.period is not None:
+                    release = node.nextRelease(release)
+                    await self.waitFor(stop_event, release - time.monotonic())
+                elif node.wait_for_input:
+                    if node.input_buses[0].seq == input_seqs[0]:
+                        await self.waitFor(wake_event, node.delay)
+                elif node.trigger is not None:
+                    while not node.inputsTriggered(input_seqs):
+                        if node.termination_signal.is_set():
+                            return
+                        wake_event.clear()
+                        await self.waitFor(wake_event, None)
+                    await self.waitFor(stop_event, cycle_start + node.min_interval - time.monotonic())
+                else:
+                    await self.waitFor(stop_event, node.delay)
+
+        finally:
+            node.detachListeners(wake)
+
+    @staticmethod
+    async def waitFor(event, timeout):
+        # Wait for an asyncio event for at most timeout seconds (forever if timeout is None)
+        if timeout is not None and timeout <= 0:
+            await asyncio.sleep(0)
+            return
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def runAsyncNodes(producer_consumer_list, blocking=(), max_workers=2):
+    """
+    Coroutine that runs a list of nodes (ConsumerProducers or AsyncNodes) together on the current event
+    loop, see runAsync
+    """
+
+    nodes = [cp if isinstance(cp, AsyncNode) else AsyncNode(cp, any(cp is b for b in blocking))
+             for cp in producer_consumer_list]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        await asyncio.gather(*[node(executor) for node in nodes])
+
+
+@log_on_start(DEBUG, "runAsync: Starting asynchronous execution")
+@log_on_error(DEBUG, "runAsync: Encountered an error during asynchronous execution")
+@log_on_end(DEBUG, "runAsync: Finished asynchronous execution")
+def runAsync(producer_consumer_list,
+             blocking=(),  # nodes whose functions block (e.g. on hardware) and should run in the executor
+             max_workers=2):  # threads in the executor for blocking nodes
+    """
+    runAsync is a drop-in alternative to runConcurrently that runs a set of ConsumerProducer objects on a
+    single asyncio event loop instead of one thread per node. Nodes listed in blocking (or wrapped in an
+    AsyncNode with blocking=True) have their cycles offloaded to a small thread pool
+    """
+
+    asyncio.run(runAsyncNodes(producer_consumer_list, blocking, max_workers))
+
+
+class CyclicExecutive:
+    """
+    Static scheduler for multi-rate graphs. Each node's period (its period option, or else its delay) is
+    rounded to a multiple of resolution; the greatest common divisor of the periods becomes the tick and
+    their least common multiple the hyperperiod. A timer wheel with one slot per tick of the hyperperiod
+    lists the nodes released in that slot, in rate-monotonic priority order (shortest period first).
+    A dispatcher thread releases each slot on a fixed grid of time.monotonic() deadlines into a priority
+    queue served by a fixed set of worker threads, so releases are deterministic and the thread count does
+    not grow with the graph. A node still running when it is released again misses that release (counted
+    as an overrun and a skipped release). Nodes in trigger mode are only run at a release if their inputs
+    have changed
+    """
+
+    # Largest timer wheel that will be built
+    max_slots = 100000
+
+    def __init__(self,
+                 producer_consumer_list,
+                 workers=1,  # number of worker threads running the released nodes
+                 resolution=1e-4,  # seconds that periods are rounded to
+                 wcet=None):  # dictionary of node: worst-case execution time, for the schedulability report
+
+        self.nodes = list(producer_consumer_list)
+        self.workers = workers
+        self.wcet = wcet if wcet is not None else {}
+
+        # Periods in units of resolution, then in ticks
+        periods = [max(1, round(self.nodePeriod(cp) / resolution)) for cp in self.nodes]
+        base = functools.reduce(math.gcd, periods)
+        self.tick = base * resolution
+        self.node_ticks = [p // base for p in periods]
+        self.hyperperiod = functools.reduce(math.lcm, self.node_ticks)
+        if self.hyperperiod > self.max_slots:
+            raise ValueError("CyclicExecutive: hyperperiod of {:d} ticks of {:g} s is too long; "
+                             "use harmonic periods or a coarser resolution".format(self.hyperperiod, self.tick))
+
+        # Rate-monotonic priorities (0 is highest), ties broken by list order
+        order = sorted(range(len(self.nodes)), key=lambda i: (self.node_ticks[i], i))
+        self.priority = [0] * len(self.nodes)
+        for rank, i in enumerate(order):
+            self.priority[i] = rank
+
+        # Timer wheel: the nodes released in each slot of the hyperperiod, highest priority first
+        self.wheel = [tuple(i for i in order if k % self.node_ticks[i] == 0) for k in range(self.hyperperiod)]
+
+    @staticmethod
+    def nodePeriod(cp):
+        period = cp.period if cp.period is not None else cp.delay
+        if not period or period <= 0:
+            raise ValueError("{:s}: a node needs a period or a positive delay to be scheduled".format(cp.name))
+        return period
+
+    def report(self):
+        """
+        Return the schedule as a dictionary: tick, hyperperiod and, for each node in priority order, its
+        period, worst-case execution time (given in wcet, or else the longest call measured so far, or None
+        if unknown), utilization and, for a single worker, worst-case response time. The total utilization
+        is compared with the rate-monotonic bound: n(2^(1/n) - 1) for one worker (backed by exact
+        response-time analysis) and m^2/(3m - 2) for m workers. schedulable is None while any node's
+        execution time is unknown, unless the known ones already show that a deadline can be missed
+        """
+
+        order = sorted(range(len(self.nodes)), key=lambda i: self.priority[i])
+        rows = []
+        for i in order:
+            cp = self.nodes[i]
+            period = self.node_ticks[i] * self.tick
+            if cp in self.wcet:
+                wcet = self.wcet[cp]
+            elif cp.exec_histogram.count:
+                wcet = cp.exec_histogram.max
+            else:
+                wcet = None
+            rows.append({"name": cp.name, "priority": self.priority[i], "period": period, "wcet": wcet,
+                         "utilization": wcet / period if wcet is not None else None})
+
+        n = len(rows)
+        m = self.workers
+        utilization = sum(row["utilization"] or 0.0 for row in rows)
+        if m == 1:
+            bound = n * (2 ** (1 / n) - 1) if n else 1.0
+        else:
+            bound = m * m / (3 * m - 2)
+
+        # Exact response-time analysis for a single worker: R = C + sum over higher priority nodes of
+        # ceil(R / T) * C, iterated to a fixed point (or until it passes the period)
+        schedulable = utilization <= bound
+        if m == 1:
+            schedulable = True
+            for idx, row in enumerate(rows):
+                c = row["wcet"] or 0.0
+                response = c
+                while True:
+                    interference = sum(math.ceil(response / hp["period"]) * (hp["wcet"] or 0.0)
+                                       for hp in rows[:idx])
+                    if c + interference == response or c + interference > row["period"]:
+                        response = c + interference
+                        break
+                    response = c + interference
+                row["response_time"] = response
+                if response > row["period"]:
+                    schedulable = False
+
+        # Unknown execution times count as zero above, so only a missed deadline is conclusive
+        if schedulable and any(row["wcet"] is None for row in rows):
+            schedulable = None
+
+        return {"tick": self.tick,
+                "hyperperiod": self.hyperperiod * self.tick,
+                "workers": m,
+                "nodes": rows,
+                "utilization": utilization,
+                "bound": bound,
+                "schedulable": schedulable,
+                "unmeasured": [row["name"] for row in rows if row["wcet"] is None]}
+
+    def logReport(self):
+        """
+        Log the schedule report at INFO level
+        """
+
+        report = self.report()
+        logger.info("Cyclic executive: tick {:g} s, hyperperiod {:g} s, {:d} worker(s)".format(
+            report["tick"], report["hyperperiod"], report["workers"]))
+        for row in report["nodes"]:
+            logger.info("  [{:d}] {:s}: period {:g} s, wcet {}, utilization {}".format(
+                row["priority"], row["name"], row["period"],
+                "{:.3g} s".format(row["wcet"]) if row["wcet"] is not None else "unknown",
+                "{:.1%}".format(row["utilization"]) if row["utilization"] is not None else "unknown"))
+        logger.info("  total utilization {:.1%} (bound {:.1%}): {:s}".format(
+            report["utilization"], report["bound"],
+            {True: "schedulable", False: "NOT schedulable", None: "schedulability unknown"}[report["schedulable"]]))
+        if report["unmeasured"]:
+            logger.info("  no execution time known for: {:s}".format(", ".join(report["unmeasured"])))
+
+    def __call__(self):
+
+        nodes = self.nodes
+        jobs = queue.PriorityQueue()
+        busy = [False] * len(nodes)
+        last_seqs = [None] * len(nodes)
+        job_count = itertools.count()
+        errors = []
+
+        def worker():
+            while True:
+                _priority, _count, i, release = jobs.get()
+                if i is None:
+                    break
+                cp = nodes[i]
+                try:
+                    if not cp.termination_signal.is_set() and \
+                            (cp.trigger is None or last_seqs[i] is None or cp.inputsTriggered(last_seqs[i])):
+                        cp.recordRelease(release)
+                        last_seqs[i] = cp.runCycle()
+                except Exception as error:
+                    # Stop the whole graph and keep the error for __call__ to raise, so that the worker
+                    # survives to drain the jobs that are already queued
+                    errors.append(error)
+                    for other in nodes:
+                        other.terminate()
+                finally:
+                    busy[i] = False
+
+        def noWake():
+            pass
+
+        for cp in nodes:
+            cp.attachListeners(noWake)
+            if cp.checkTerminationbuses():
+                cp.terminate()
+
+        threads = [threading.Thread(target=worker, name="rossros worker {:d}".format(w)) for w in range(self.workers)]
+        for t in threads:
+            t.start()
+
+        try:
+            start = time.monotonic()
+            k = 0
+            while not all(cp.termination_signal.is_set() for cp in nodes):
+
+                # Wait for the slot's release time, then release its nodes
+                release = start + k * self.tick
+                time.sleep(max(0.0, release - time.monotonic()))
+
+                for i in self.wheel[k % self.hyperperiod]:
+                    cp = nodes[i]
+                    if cp.termination_signal.is_set():
+                        continue
+                    if busy[i]:
+                        cp.overrun_count += 1
+                        cp.skipped_count += 1
+                        continue
+                    busy[i] = True
+                    jobs.put((self.priority[i], next(job_count), i, release))
+
+                k += 1
+        finally:
+            # Stop the workers once the jobs already queued have run
+            for _ in threads:
+                jobs.put((len(nodes), next(job_count), None, 0.0))
+            for t in threads:
+                t.join()
+            for cp in nodes:
+                cp.detachListeners(noWake)
+
+        if errors:
+            raise errors[0]
+
+
+@log_on_start(DEBUG, "runCyclic: Starting cyclic execution")
+@log_on_error(DEBUG, "runCyclic: Encountered an error during cyclic execution")
+@log_on_end(DEBUG, "runCyclic: Finished cyclic execution")
+def runCyclic(producer_consumer_list,
+              workers=1,  # number of worker threads
+              wcet=None):  # dictionary of node: worst-case execution time, for the startup report
+    """
+    runCyclic is an alternative to runConcurrently that runs a set of ConsumerProducer objects from a
+    rate-monotonic CyclicExecutive with a fixed number of worker threads, after logging its schedule and
+    schedulability report. Returns the executive, whose report() then includes the measured times. If a
+    node raises an exception, every node is terminated and the exception is raised from runCyclic
+    """
+
+    executive = CyclicExecutive(producer_consumer_list, workers, wcet=wcet)
+    executive.logReport()
+    executive()
+    return executive
@@ -0,0 +1,673 @@
+#!/usr/bin/python3
+"""
+This file benchmarks the building blocks of RossROS.
+
+Bus contention: one writer thread and a varying number of reader threads hammer the same bus for a fixed
+time, and the read and write rates are reported for the lock-based Bus and for SingleWriterBus. The bus
+methods are called without their logging decorators, so that the numbers reflect the locking scheme
+rather than the cost of building log records.
+
+Bus call overhead: a single thread reads and writes a bus with its logging decorators bound (tracing on)
+and in fast mode (tracing off), showing the per-call cost of the decorators.
+
+Bus bridge loopback: two BusBridges in one process mirror a set of buses over a Unix domain socket while
+a writer thread writes to them as fast as it can. Writes are coalesced to the latest value per bus per
+flush tick, so the delivered message rate is reported alongside the write rate, together with the one-way
+latency from write to delivery.
+
+TCP bridge check: two TCPBusBridges talk through a LatencyShim on 127.0.0.1 that delays every chunk of
+data in each direction. The check confirms that messages arrive, reports the round-trip and one-way
+times against the simulated latency, then cuts the link and confirms that the fallback value was written
+and that the bridges reconnected.
+
+Node loop overhead: a Producer and a ConsumerProducer with no-op functions and no delay run flat out, and
+their cycle rates show the fixed cost of a cycle (reading, calling, writing and instrumenting).
+
+Period jitter: a period-mode Producer runs at 10, 20, 100 and 1000 Hz, with plain waits and with a
+HybridSleeper, and the lateness of its releases is reported.
+
+Chain latency: a traced Producer feeds chains of 1 to 20 trigger-mode stages ending in a Consumer, and the
+end-to-end latency of each chain comes from the latency tracing.
+
+Demo graph: the rr_demo.py graph (square and sawtooth producers, a multiplier and a printer) runs for a
+fixed time under each executor (threads, asyncio and the cyclic executive) and with each latest-value bus
+class. The node cycle rates are reported, together with the shutdown latency: the time from the write to
+the termination bus until the executor returns.
+
+Run it directly on the Pi (python3 rr_benchmark.py); it does not touch any hardware. All results are
+also written as JSON (to rr_benchmark.json, or the file given with --output), so that runs with
+different bus implementations, executors or machines can be compared; --quick shortens every benchmark.
+"""
+
+import rossros as rr
+import rr_timing
+import argparse
+import inspect
+import io
+import json
+import math
+import os
+import platform
+import queue
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+# Number of calls made between checks of the stop flag, so that checking it does not dominate the loop
+BATCH = 100
+
+
+def bus_contention(bus_class, n_readers, duration=1.0):
+    """
+    Run one writer and n_readers readers against a bus of class bus_class for duration seconds, and
+    return the (reads per second, writes per second) that were achieved
+    """
+
+    bus = bus_class(0, "Benchmark bus")
+
+    # Undecorated bus methods, called with the bus as their first argument
+    get_message = inspect.unwrap(bus_class.get_message)
+    set_message = inspect.unwrap(bus_class.set_message)
+
+    stop = threading.Event()
+    read_counts = [0] * n_readers
+    write_counts = [0]
+
+    def reader(idx):
+        n = 0
+        while not stop.is_set():
+            for _ in range(BATCH):
+                get_message(bus)
+            n += BATCH
+        read_counts[idx] = n
+
+    def writer():
+        n = 0
+        while not stop.is_set():
+            for i in range(BATCH):
+                set_message(bus, i)
+            n += BATCH
+        write_counts[0] = n
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(n_readers)]
+    threads.append(threading.Thread(target=writer))
+
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    return sum(read_counts) / duration, write_counts[0] / duration
+
+
+# Latest-value bus classes compared by the bus and demo graph benchmarks
+BUS_CLASSES = (rr.Bus, rr.SingleWriterBus, rr.HistoryBus)
+
+
+def run_bus_contention(reader_counts=(1, 2, 4, 8, 16), duration=1.0, bus_classes=BUS_CLASSES):
+    """
+    Print a table of bus_contention results for each bus class over a range of reader counts, and return
+    them as a list of dictionaries
+    """
+
+    print("Bus contention, 1 writer (operations per second)")
+    print("{:>16s} {:>8s} {:>14s} {:>14s}".format("bus", "readers", "reads", "writes"))
+
+    results = []
+    for bus_class in bus_classes:
+        for n in reader_counts:
+            reads, writes = bus_contention(bus_class, n, duration)
+            print("{:>16s} {:>8d} {:>14.0f} {:>14.0f}".format(bus_class.__name__, n, reads, writes))
+            results.append({"bus": bus_class.__name__, "readers": n, "reads_per_s": reads, "writes_per_s": writes})
+
+    return results
+
+
+def bus_call_overhead(trace, n_calls=100000):
+    """
+    Time n_calls reads and n_calls writes on a Bus with tracing switched on or off, and return the
+    (read, write) cost per call in microseconds
+    """
+
+    bus = rr.Bus(0, "Benchmark bus")
+    bus.set_trace(trace)
+
+    t_start = time.perf_counter()
+    for _ in range(n_calls):
+        bus.get_message("benchmark")
+    t_read = time.perf_counter() - t_start
+
+    t_start = time.perf_counter()
+    for i in range(n_calls):
+        bus.set_message(i, "benchmark")
+    t_write = time.perf_counter() - t_start
+
+    return 1e6 * t_read / n_calls, 1e6 * t_write / n_calls
+
+
+def run_bus_call_overhead(n_calls=100000):
+    """
+    Print the per-call cost of bus reads and writes with and without the logging decorators
+    """
+
+    print("Bus call overhead (microseconds per call)")
+    print("{:>10s} {:>10s} {:>10s}".format("mode", "read", "write"))
+
+    results = []
+    for mode, trace in (("decorated", True), ("fast", False)):
+        read_us, write_us = bus_call_overhead(trace, n_calls)
+        print("{:>10s} {:>10.2f} {:>10.2f}".format(mode, read_us, write_us))
+        results.append({"mode": mode, "read_us": read_us, "write_us": write_us})
+
+    return results
+
+
+def bridge_loopback(n_buses, flush_interval, duration=1.0):
+    """
+    Mirror n_buses buses between two BusBridges over a Unix domain socket for duration seconds, with a
+    writer thread writing to them round-robin. Returns (writes per second, delivered messages per second,
+    one-way latency summary)
+    """
+
+    address = os.path.join(tempfile.mkdtemp(), "bridge.sock")
+    terminate = rr.Bus(0, "Benchmark termination bus")
+    sources = tuple(rr.Bus(0, "Bus {:d}".format(i)) for i in range(n_buses))
+    mirrors = tuple(rr.Bus(0, "Bus {:d}".format(i)) for i in range(n_buses))
+
+    server = rr.BusBridge(address, (), mirrors, "server", flush_interval, terminate, "Benchmark server")
+    client = rr.BusBridge(address, sources, (), "client", flush_interval, terminate, "Benchmark client")
+    runner = threading.Thread(target=rr.runConcurrently, args=([server, client],))
+    runner.start()
+    client.connected.wait(5.0)
+
+    write_count = 0
+    t_start = time.perf_counter()
+    t_end = t_start + duration
+    while time.perf_counter() < t_end:
+        for _ in range(BATCH):
+            sources[write_count % n_buses].set_message(write_count, "benchmark")
+            write_count += 1
+    elapsed = time.perf_counter() - t_start
+
+    terminate.set_message(1, "benchmark")
+    runner.join()
+    os.rmdir(os.path.dirname(address))
+
+    return write_count / elapsed, server.messages_received / elapsed, server.latency_histogram.summary()
+
+
+def run_bridge_loopback(bus_counts=(1, 8), flush_intervals=(0.001, 0.01), duration=1.0):
+    """
+    Print a table of bridge_loopback results over a range of bus counts and flush ticks
+    """
+
+    print("Bus bridge loopback over a Unix domain socket")
+    print("{:>6s} {:>10s} {:>12s} {:>12s} {:>10s} {:>10s}".format(
+        "buses", "flush (s)", "writes/s", "delivered/s", "p50 (ms)", "p99 (ms)"))
+
+    results = []
+    for n in bus_counts:
+        for flush_interval in flush_intervals:
+            writes, delivered, latency = bridge_loopback(n, flush_interval, duration)
+            print("{:>6d} {:>10g} {:>12.0f} {:>12.0f} {:>10.3f} {:>10.3f}".format(
+                n, flush_interval, writes, delivered, 1e3 * latency["p50"], 1e3 * latency["p99"]))
+            results.append({"buses": n, "flush_interval": flush_interval, "writes_per_s": writes,
+                            "delivered_per_s": delivered, "latency": latency})
+
+    return results
+
+
+class LatencyShim:
+    """
+    TCP proxy for testing bridges on one machine: it listens on 127.0.0.1 (its address attribute) and
+    forwards each connection to target, holding every chunk of data for latency seconds, plus up to jitter
+    seconds, in each direction (order is preserved). cut() drops the current connections, to simulate a
+    link failure
+    """
+
+    def __init__(self,
+                 target,  # (host, port) to forward to
+                 latency=0.01,  # one-way delay in seconds
+                 jitter=0.0,  # largest extra random delay in seconds
+                 port=0):  # port to listen on (0 picks a free one)
+
+        self.target = target
+        self.latency = latency
+        self.jitter = jitter
+        self.stop_event = threading.Event()
+        self.connections = []
+        self.lock = threading.Lock()
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(("127.0.0.1", port))
+        self.server.listen(4)
+        self.server.settimeout(0.2)
+        self.address = self.server.getsockname()
+
+        threading.Thread(target=self.acceptLoop, name="Latency shim", daemon=True).start()
+
+    def acceptLoop(self):
+
+        while not self.stop_event.is_set():
+            try:
+                downstream, _peer = self.server.accept()
+            except OSError:
+                continue
+            try:
+                upstream = socket.create_connection(self.target)
+            except OSError:
+                downstream.close()
+                continue
+            # Forward each chunk as soon as it is due, without Nagle's algorithm holding it back
+            for sock in (downstream, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                self.connections.append((downstream, upstream))
+            for source, sink in ((downstream, upstream), (upstream, downstream)):
+                threading.Thread(target=self.forward, args=(source, sink), daemon=True).start()
+
+    def forward(self, source, sink):
+
+        # Receive into a queue of (delivery time, data); a second thread delivers them when due
+        chunks = queue.Queue()
+
+        def deliver():
+            while True:
+                due, data = chunks.get()
+                if data is None:
+                    break
+                time.sleep(max(0.0, due - time.monotonic()))
+                try:
+                    sink.sendall(data)
+                except OSError:
+                    break
+            self.closePair(source, sink)
+
+        threading.Thread(target=deliver, daemon=True).start()
+
+        last_due = 0.0
+        while True:
+            try:
+                data = source.recv(65536)
+            except OSError:
+                data = b""
+            if not data:
+                chunks.put((0.0, None))
+                break
+            # Never deliver a chunk before the one received ahead of it
+            due = max(last_due, time.monotonic() + self.latency + random.uniform(0.0, self.jitter))
+            last_due = due
+            chunks.put((due, data))
+
+    def closePair(self, *socks):
+
+        for sock in socks:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def cut(self):
+        """
+        Drop all current connections
+        """
+
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for pair in connections:
+            self.closePair(*pair)
+
+    def close(self):
+        """
+        Drop all connections and stop listening
+        """
+
+        self.stop_event.set()
+        self.cut()
+        self.server.close()
+
+
+def free_port():
+    """
+    Return a TCP port on 127.0.0.1 that is free at the moment
+    """
+
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def tcp_bridge_check(latency=0.02, jitter=0.005, duration=1.0):
+    """
+    Mirror a bus from a server TCPBusBridge to a client through a LatencyShim with the given one-way
+    latency and jitter, then cut the link. Returns the messages delivered, the client's round-trip and
+    one-way time summaries, whether the client's fallback value was written, how many times the link
+    dropped, and whether messages flowed again after reconnecting
+    """
+
+    address = ("127.0.0.1", free_port())
+    terminate = rr.Bus(0, "Benchmark termination bus")
+    source = rr.Bus([0.0] * 64, "Source")
+    mirror = rr.Bus(None, "Source")
+
+    count = [0]
+
+    def produce():
+        count[0] += 1
+        return [float(count[0])] * 64
+
+    fallback_seen = []
+    mirror.add_listener(lambda: fallback_seen.append(True) if mirror.message == -1 else None)
+
+    nodes = [rr.Producer(produce, source, 0.01, terminate, "Source producer"),
+             rr.TCPBusBridge(address, source, (), "server", 0.01, terminate, "Server bridge", compress_level=1)]
+    server = nodes[1]
+    # The shim needs the server to be listening before it can forward a connection
+    runner = threading.Thread(target=rr.runConcurrently, args=(nodes,))
+    runner.start()
+    time.sleep(0.1)
+
+    shim = LatencyShim(address, latency, jitter)
+    client = rr.TCPBusBridge(shim.address, (), mirror, "client", 0.01, terminate, "Client bridge",
+                             reconnect_interval=0.1, fallback={"Source": -1})
+    client_runner = threading.Thread(target=rr.runConcurrently, args=([client],))
+    client_runner.start()
+
+    time.sleep(duration)
+    delivered = client.messages_received
+    shim.cut()
+    time.sleep(0.5 + 2 * latency)
+    received_before = client.messages_received
+    time.sleep(0.5)
+    reconnected = client.messages_received > received_before
+
+    terminate.set_message(1, "benchmark")
+    runner.join()
+    client_runner.join()
+    shim.close()
+
+    return {"latency": latency,
+            "jitter": jitter,
+            "delivered": delivered,
+            "frames_sent": server.frames_sent,
+            "rtt": client.rtt_histogram.summary(),
+            "one_way": client.latency_histogram.summary(),
+            "fallback_written": bool(fallback_seen),
+            "link_drops": client.link_drop_count,
+            "reconnected": reconnected}
+
+
+def run_tcp_bridge_check(latencies=(0.0, 0.02), duration=1.0):
+    """
+    Print and return tcp_bridge_check results for a range of simulated latencies
+    """
+
+    print("TCP bridge over a LatencyShim on 127.0.0.1")
+    print("{:>12s} {:>10s} {:>14s} {:>16s} {:>9s} {:>12s}".format(
+        "latency (ms)", "delivered", "rtt p50 (ms)", "one-way p50 (ms)", "fallback", "reconnected"))
+
+    results = []
+    for latency in latencies:
+        result = tcp_bridge_check(latency, duration=duration)
+        print("{:>12.1f} {:>10d} {:>14.2f} {:>16.2f} {:>9s} {:>12s}".format(
+            1e3 * latency, result["delivered"], 1e3 * result["rtt"]["p50"], 1e3 * result["one_way"]["p50"],
+            str(result["fallback_written"]), str(result["reconnected"])))
+        results.append(result)
+
+    return results
+
+
+def noop(*_values):
+    return 0
+
+
+def runFor(nodes, terminate, duration, executor=rr.runConcurrently):
+    """
+    Run a list of nodes with the given executor for duration seconds, then write the termination bus.
+    Returns the time from that write until the executor returned
+    """
+
+    runner = threading.Thread(target=executor, args=(nodes,))
+    runner.start()
+    time.sleep(duration)
+
+    t_terminate = time.perf_counter()
+    terminate.set_message(1, "benchmark")
+    runner.join()
+    return time.perf_counter() - t_terminate
+
+
+def loop_overhead(duration=1.0):
+    """
+    Run a no-op Producer and a no-op one-input, one-output ConsumerProducer with no delay for duration
+    seconds (each on its own), and return their cycle rates and the time per cycle in microseconds
+    """
+
+    results = {}
+    for kind in ("Producer", "ConsumerProducer"):
+        terminate = rr.Bus(0, "Benchmark termination bus")
+        if kind == "Producer":
+            node = rr.Producer(noop, rr.Bus(0, "Output bus"), 0, terminate, "No-op producer")
+        else:
+            node = rr.ConsumerProducer(noop, rr.Bus(0, "Input bus"), rr.Bus(0, "Output bus"), 0, terminate,
+                                       "No-op consumer-producer")
+        runFor([node], terminate, duration)
+        results[kind] = {"cycles_per_s": node.call_count / duration,
+                         "us_per_cycle": 1e6 * duration / node.call_count if node.call_count else None}
+
+    return results
+
+
+def run_loop_overhead(duration=1.0):
+    """
+    Print and return the loop_overhead results
+    """
+
+    print("Node loop overhead with a no-op function")
+    print("{:>18s} {:>12s} {:>12s}".format("node", "cycles/s", "us/cycle"))
+
+    results = loop_overhead(duration)
+    for kind, result in results.items():
+        print("{:>18s} {:>12.0f} {:>12.2f}".format(kind, result["cycles_per_s"], result["us_per_cycle"]))
+
+    return results
+
+
+def period_jitter(rate, duration=2.0, timing=None):
+    """
+    Run a no-op period-mode Producer at rate Hz for duration seconds, optionally with a HybridSleeper, and
+    return its release timing record and the summary of its actual periods
+    """
+
+    terminate = rr.Bus(0, "Benchmark termination bus")
+    node = rr.Producer(noop, rr.Bus(0, "Output bus"), 0, terminate, "Periodic producer",
+                       period=1.0 / rate, timing=timing)
+    runFor([node], terminate, duration)
+
+    stats = node.stats()
+    return {"release": stats["release"], "period": stats["period"]}
+
+
+def run_period_jitter(rates=(10, 20, 100, 1000), duration=2.0):
+    """
+    Print and return period_jitter results over a range of rates, with plain waits and with a
+    HybridSleeper
+    """
+
+    print("Period jitter (release lateness)")
+    print("{:>8s} {:>8s} {:>8s} {:>12s} {:>12s} {:>10s}".format(
+        "rate", "waits", "cycles", "mean (ms)", "max (ms)", "skipped"))
+
+    results = []
+    for rate in rates:
+        for waits in ("plain", "hybrid"):
+            result = period_jitter(rate, duration, rr_timing.HybridSleeper() if waits == "hybrid" else None)
+            release = result["release"]
+            print("{:>8d} {:>8s} {:>8d} {:>12.3f} {:>12.3f} {:>10d}".format(
+                rate, waits, release["cycles"], 1e3 * release["jitter_mean"], 1e3 * release["jitter_max"],
+                release["skipped"]))
+            results.append(dict(result, rate=rate, waits=waits))
+
+    return results
+
+
+def chain_latency(stages, duration=2.0, rate=20):
+    """
+    Run a traced Producer at rate Hz feeding a chain of trigger-mode ConsumerProducers (stages of them)
+    ending in a Consumer, for duration seconds, and return the end-to-end latency summary of the chain
+    """
+
+    terminate = rr.Bus(0, "Benchmark termination bus")
+    signal = rr.TerminationSignal()
+    buses = [rr.SingleWriterBus(0, "Stage bus {:d}".format(i)) for i in range(stages + 1)]
+
+    nodes = [rr.Producer(time.monotonic, buses[0], 0, terminate, "Source", period=1.0 / rate,
+                         trace_latency=True, termination_signal=signal)]
+    for i in range(stages):
+        nodes.append(rr.ConsumerProducer(lambda value: value, buses[i], buses[i + 1], 0.1, terminate,
+                                         "Stage {:d}".format(i + 1), trigger="any", termination_signal=signal))
+    nodes.append(rr.Consumer(noop, buses[stages], 0.1, terminate, "Sink", trigger="any",
+                             termination_signal=signal))
+
+    rr.resetLatencyReport()
+    runFor(nodes, terminate, duration)
+
+    path = " -> ".join(node.name for node in nodes)
+    return rr.latencyReport().get(path)
+
+
+def run_chain_latency(stage_counts=(1, 2, 5, 10, 20), duration=2.0):
+    """
+    Print and return chain_latency results over a range of chain lengths
+    """
+
+    print("End-to-end latency through a chain of trigger-mode stages")
+    print("{:>8s} {:>8s} {:>10s} {:>10s} {:>10s}".format("stages", "samples", "p50 (ms)", "p99 (ms)", "max (ms)"))
+
+    results = []
+    for stages in stage_counts:
+        latency = chain_latency(stages, duration)
+        if latency is None:
+            print("{:>8d} {:>8s}".format(stages, "none"))
+        else:
+            print("{:>8d} {:>8d} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                stages, latency["count"], 1e3 * latency["p50"], 1e3 * latency["p99"], 1e3 * latency["max"]))
+        results.append({"stages": stages, "latency": latency})
+
+    return results
+
+
+# Signal generation and processing functions of the rr_demo.py graph
+def square():
+    return (2 * math.floor(time.time() % 2)) - 1
+
+
+def sawtooth():
+    return time.time() % 1
+
+
+def mult(a, b):
+    return a * b
+
+
+# Executors the demo graph is run under (the cyclic executive without runCyclic's schedule report)
+EXECUTORS = {"threads": rr.runConcurrently,
+             "async": rr.runAsync,
+             "cyclic": lambda nodes: rr.CyclicExecutive(nodes)()}
+
+
+def demo_graph(bus_class=rr.Bus, executor="threads", duration=1.0):
+    """
+    Build the rr_demo.py graph on buses of class bus_class (printing to a discarded buffer), run it under
+    the named executor for duration seconds, and return each node's cycle rate and the shutdown latency
+    """
+
+    bSquare = bus_class(square(), "Square wave bus")
+    bSawtooth = bus_class(sawtooth(), "Sawtooth wave Bus")
+    bMultiplied = bus_class(sawtooth() * square(), "Multiplied wave bus")
+    bTerminate = rr.Bus(0, "Termination Bus")
+
+    nodes = [rr.Producer(square, bSquare, 0.05, bTerminate, "Read square wave signal"),
+             rr.Producer(sawtooth, bSawtooth, 0.05, bTerminate, "Read sawtooth wave signal"),
+             rr.ConsumerProducer(mult, (bSquare, bSawtooth), bMultiplied, 0.05, bTerminate, "Multiply Waves"),
+             rr.Printer((bSquare, bSawtooth, bMultiplied, bTerminate), 0.25, bTerminate,
+                        "Print raw and derived data", "Data bus readings are: ", output=io.StringIO()),
+             # The timer only counts down here; the benchmark ends the run itself
+             rr.Timer(bTerminate, 0, 0.01, bTerminate, "Termination timer")]
+
+    shutdown = runFor(nodes, bTerminate, duration, EXECUTORS[executor])
+
+    return {"bus": bus_class.__name__,
+            "executor": executor,
+            "calls_per_s": {node.name: node.call_count / duration for node in nodes},
+            "shutdown_latency": shutdown}
+
+
+def run_demo_graph(duration=1.0, bus_classes=BUS_CLASSES, executors=tuple(EXECUTORS)):
+    """
+    Print and return demo_graph results for every combination of bus class and executor
+    """
+
+    print("rr_demo.py graph (cycles per second; shutdown latency)")
+    print("{:>16s} {:>8s} {:>8s} {:>8s} {:>8s} {:>14s}".format(
+        "bus", "executor", "square", "multiply", "timer", "shutdown (ms)"))
+
+    results = []
+    for bus_class in bus_classes:
+        for executor in executors:
+            result = demo_graph(bus_class, executor, duration)
+            rates = result["calls_per_s"]
+            print("{:>16s} {:>8s} {:>8.1f} {:>8.1f} {:>8.1f} {:>14.2f}".format(
+                bus_class.__name__, executor, rates["Read square wave signal"], rates["Multiply Waves"],
+                rates["Termination timer"], 1e3 * result["shutdown_latency"]))
+            results.append(result)
+
+    return results
+
+
+def run_all(quick=False):
+    """
+    Run every benchmark (shortened if quick is set), printing their tables, and return all the results
+    in one dictionary along with a description of the machine
+    """
+
+    duration = 0.25 if quick else 1.0
+
+    benchmarks = (("bus_call_overhead", lambda: run_bus_call_overhead(10000 if quick else 100000)),
+                  ("bus_contention", lambda: run_bus_contention((1, 4) if quick else (1, 2, 4, 8, 16), duration)),
+                  ("loop_overhead", lambda: run_loop_overhead(duration)),
+                  ("period_jitter", lambda: run_period_jitter(duration=2 * duration)),
+                  ("chain_latency", lambda: run_chain_latency(duration=2 * duration)),
+                  ("demo_graph", lambda: run_demo_graph(duration)),
+                  ("bridge_loopback", lambda: run_bridge_loopback(duration=duration)),
+                  ("tcp_bridge", lambda: run_tcp_bridge_check(duration=duration)))
+
+    results = {"machine": {"platform": platform.platform(),
+                           "python": sys.version.split()[0],
+                           "cpus": os.cpu_count(),
+                           "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+               "quick": quick}
+    for key, benchmark in benchmarks:
+        results[key] = benchmark()
+        print()
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the building blocks of RossROS")
+    parser.add_argument("--output", default="rr_benchmark.json", help="file to write the JSON results to")
+    parser.add_argument("--quick", action="store_true", help="shorten every benchmark")
+    args = parser.parse_args()
+
+    results = run_all(args.quick)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results written to {:s}".format(args.output))
@@ -15,12 +15,14 @@ Fourth, it creates a RossROS Printer object to periodically display the current
 object to terminate the program after a fixed number of seconds
 
 Fifth and finally, it makes a list of all of the RossROS objects and sends them to the runConcurrently function
-for simultaneous execution
+for simultaneous execution (or, if the program is run with the argument "async", to the runAsync function, which
+runs the same objects on a single asyncio event loop)
 
 """
 
 import rossros as rr
 import logging
+import sys
 import time
 import math
 
@@ -114,4 +116,7 @@ producer_consumer_list = [readSquare,
                           terminationTimer]
 
 # Execute the list of producer-consumers concurrently
-rr.runConcurrently(producer_consumer_list)
\ No newline at end of file
+if len(sys.argv) > 1 and sys.argv[1] == "async":
+    rr.runAsync(producer_consumer_list)
+else:
+    rr.runConcurrently(producer_consumer_list)
\ No newline at end of file
@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+"""
+This file provides high-resolution waits for RossROS.
+
+time.sleep and Event.wait can overshoot their timeout by 0.1-1 ms on the Pi, which is large next to
+short node delays and sub-millisecond pulses. A HybridSleeper sleeps coarsely until shortly before the
+deadline, then spins on time.perf_counter_ns() for the last stretch. The spin margin adapts to the
+overshoot it measures from its own coarse sleeps, so only the final fraction of a millisecond is spent
+spinning. While spinning, the sleeper yields the interpreter lock (time.sleep(0)) so that the other nodes'
+threads keep running, except for a short final stretch of pure spinning. Each sleeper records its wake-up error (how late it returned relative to the deadline).
+
+ConsumerProducer (and so Timer and the other node classes) accepts a HybridSleeper through its timing
+option; spinWait is a pure spin for pulses of a few microseconds.
+"""
+
+import time
+
+
+class HybridSleeper:
+    """
+    Sleep-then-spin waiter with an adaptive spin margin and a wake-up error record. One sleeper should be
+    used by one thread (e.g. one per node), since its statistics are not locked
+    """
+
+    def __init__(self,
+                 spin=0.0005,  # initial seconds before the deadline at which sleeping gives way to spinning
+                 adaptive=True,  # adjust the spin margin to the measured overshoot of the coarse sleeps
+                 min_spin=0.0001,  # bounds on the adaptive spin margin, in seconds
+                 max_spin=0.002,
+                 pure_spin=0.0001):  # final seconds spun without yielding the interpreter lock
+
+        self.spin_ns = int(spin * 1e9)
+        self.adaptive = adaptive
+        self.min_spin_ns = int(min_spin * 1e9)
+        self.max_spin_ns = int(max_spin * 1e9)
+        self.pure_spin_ns = int(pure_spin * 1e9)
+
+        # Wake-up error record, in nanoseconds (positive: returned after the deadline)
+        self.wake_count = 0
+        self.error_last_ns = 0
+        self.error_sum_ns = 0
+        self.error_max_ns = 0
+
+        # Total time spent spinning, in nanoseconds
+        self.spin_time_ns = 0
+
+    def wait(self, seconds, event=None):
+        """
+        Wait for the given number of seconds, or until event (anything with wait(timeout) and is_set(),
+        such as a threading.Event or a TerminationSignal) is set. Returns True if the event was set
+        """
+
+        return self.wait_until_ns(time.perf_counter_ns() + int(seconds * 1e9), event)
+
+    def wait_until_ns(self, deadline_ns, event=None):
+        """
+        Wait until time.perf_counter_ns() reaches deadline_ns, or until event is set. Returns True if the
+        event was set
+        """
+
+        # Coarse phase: sleep (or wait on the event) until the spin margin before the deadline
+        coarse_end_ns = deadline_ns - self.spin_ns
+        coarse_ns = coarse_end_ns - time.perf_counter_ns()
+        if coarse_ns > 0:
+            if event is not None:
+                if event.wait(coarse_ns / 1e9):
+                    return True
+            else:
+                time.sleep(coarse_ns / 1e9)
+
+            if self.adaptive:
+                # Keep the margin at 1.5 times the latest overshoot, decaying slowly after large ones
+                overshoot_ns = time.perf_counter_ns() - coarse_end_ns
+                self.spin_ns = min(self.max_spin_ns, max(self.min_spin_ns, int(1.5 * overshoot_ns),
+                                                         self.spin_ns * 63 // 64))
+
+        # Fine phase: spin on the clock for the rest of the way, yielding to other threads until the final
+        # stretch (time.sleep(0) itself takes tens of microseconds, so it is not used right at the end)
+        spin_start_ns = now_ns = time.perf_counter_ns()
+        yield_end_ns = deadline_ns - self.pure_spin_ns
+        while now_ns < deadline_ns:
+            if event is not None and event.is_set():
+                return True
+            if now_ns < yield_end_ns:
+                time.sleep(0)
+            now_ns = time.perf_counter_ns()
+
+        self.spin_time_ns += now_ns - spin_start_ns
+        self.recordWake(now_ns - deadline_ns)
+        return event is not None and event.is_set()
+
+    def recordWake(self, error_ns):
+        self.wake_count += 1
+        self.error_last_ns = error_ns
+        self.error_sum_ns += error_ns
+        self.error_max_ns = max(self.error_max_ns, error_ns)
+
+    def stats(self):
+        """
+        Return the wake-up error record as a dictionary, in seconds: number of completed waits, last, mean
+        and largest error, the current spin margin, and the total time spent spinning
+        """
+
+        return {"wakeups": self.wake_count,
+                "error_last": self.error_last_ns / 1e9,
+                "error_mean": self.error_sum_ns / self.wake_count / 1e9 if self.wake_count else 0.0,
+                "error_max": self.error_max_ns / 1e9,
+                "spin": self.spin_ns / 1e9,
+                "spin_time": self.spin_time_ns / 1e9}
+
+
+def spinWait(seconds):
+    """
+    Busy-wait for a short time (such as a 10 microsecond trigger pulse) without giving up the processor
+    """
+
+    deadline_ns = time.perf_counter_ns() + int(seconds * 1e9)
+    while time.perf_counter_ns() < deadline_ns:
+        pass
+
+
+if __name__ == "__main__":
+    # Compare the wake-up error of time.sleep with that of a HybridSleeper (medians, since occasional
+    # preemptions by the operating system dominate the means of both)
+    for interval in (0.0002, 0.001, 0.01):
+        sleep_errors = []
+        hybrid_errors = []
+        sleeper = HybridSleeper()
+        for _ in range(200):
+            start = time.perf_counter()
+            time.sleep(interval)
+            sleep_errors.append(time.perf_counter() - start - interval)
+            sleeper.wait(interval)
+            hybrid_errors.append(sleeper.error_last_ns / 1e9)
+        print("{:g} s: median wake-up error {:.1f} us with time.sleep, {:.1f} us with HybridSleeper "
+              "(spin margin {:.0f} us)".format(interval, 1e6 * sorted(sleep_errors)[100],
+                                              1e6 * sorted(hybrid_errors)[100], 1e6 * sleeper.spin_ns / 1e9))